@@ -6,6 +6,7 @@ from starlette.responses import RedirectResponse
 
 from .models import Document, Tag
 from .config import get_settings
+from .cache import invalidate_search_caches
 
 
 class ApiKeyAuth(AuthenticationBackend):
@@ -31,7 +32,17 @@ class ApiKeyAuth(AuthenticationBackend):
         return api_key == get_settings().api_key
 
 
-class DocumentAdmin(ModelView, model=Document):
+class InvalidatesSearchCaches:
+    """Mixin for admin views whose writes change search results"""
+
+    async def after_model_change(self, data, model, is_created, request):
+        invalidate_search_caches()
+
+    async def after_model_delete(self, model, request):
+        invalidate_search_caches()
+
+
+class DocumentAdmin(InvalidatesSearchCaches, ModelView, model=Document):
     column_list = [
         Document.id,
         Document.title,
@@ -75,7 +86,7 @@ class DocumentAdmin(ModelView, model=Document):
     ]
 
 
-class TagAdmin(ModelView, model=Tag):
+class TagAdmin(InvalidatesSearchCaches, ModelView, model=Tag):
     column_list = [Tag.id, Tag.name, Tag.description, "documents"]
     column_searchable_list = [Tag.name, Tag.description]
     can_create = True
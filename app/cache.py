@@ -0,0 +1,134 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from sqlalchemy import text
+
+from .config import get_settings
+
+
+class LRUCache:
+    """
+    Thread-safe LRU map bounded by entry count and, optionally, by the total
+    size of its values as reported by `sizeof`.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = lambda value: 0,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class _Generation:
+    """
+    Counter bumped by every write. Cache keys include the generation they
+    were computed under, so a result computed while a write lands can never
+    be served afterwards.
+    """
+
+    def __init__(self):
+        self.value = 0
+        # Last searchdataversion seen by sync_search_caches
+        self.data_version = None
+        self._lock = threading.Lock()
+
+    def bump(self) -> None:
+        with self._lock:
+            self.value += 1
+
+
+settings = get_settings()
+write_generation = _Generation()
+
+# Exact search totals keyed by (generation, query, filters)
+search_count_cache = LRUCache(max_entries=settings.search_count_cache_max_entries)
+
+# Search result pages keyed by (generation, query, filters, page); sized by
+# their serialized JSON length
+search_result_cache = LRUCache(
+    max_entries=settings.search_cache_max_entries,
+    max_bytes=settings.search_cache_max_bytes,
+    sizeof=lambda response: len(response.model_dump_json()),
+)
+
+
+def invalidate_search_caches() -> None:
+    """Drop everything derived from the current documents and tags"""
+    write_generation.bump()
+    search_count_cache.clear()
+    search_result_cache.clear()
+
+
+def sync_search_caches(connection) -> int:
+    """
+    Invalidate the search caches if the database changed since the last
+    call, including writes by other processes that never call
+    `invalidate_search_caches`, and return the generation to key cache
+    entries with. Triggers bump searchdataversion on every write to the
+    searchable tables.
+    """
+    version = connection.execute(
+        text("SELECT version FROM searchdataversion")
+    ).scalar()
+    if version != write_generation.data_version:
+        invalidate_search_caches()
+        write_generation.data_version = version
+    return write_generation.value
+
+
+def cache_stats() -> dict:
+    return {
+        "generation": write_generation.value,
+        "search_counts": search_count_cache.stats(),
+        "search_results": search_result_cache.stats(),
+    }
@@ -1,3 +1,4 @@
+from typing import List, Optional
 from pydantic_settings import BaseSettings
 from pathlib import Path
 
@@ -7,6 +8,53 @@ class Settings(BaseSettings):
     database_url: str = "sqlite:///app/data/crumpet.db"
     api_key: str = "dev_api_key"
 
+    # Token prefix lengths indexed by documentfts. Only applied when the table
+    # is created; existing databases are rebuilt by a migration.
+    fts_prefix_lengths: List[int] = [2, 3, 4]
+
+    # FTS5 merge options, stored in documentfts at startup: merge once
+    # `fts_automerge` segments share a level, and block writes to merge once
+    # `fts_crisismerge` do
+    fts_automerge: int = 4
+    fts_crisismerge: int = 16
+
+    # Background merging of documentfts segments: every interval (0
+    # disables it), write up to `fts_merge_pages` pages of merged segments
+    fts_maintenance_interval_seconds: float = 3600.0
+    fts_merge_pages: int = 1000
+
+    # Maintain a trigram index for `mode=substring` searches
+    fts_trigram_enabled: bool = True
+
+    # bm25() column weights for search ranking (title, description, content, tag_data)
+    search_weight_title: float = 10.0
+    search_weight_description: float = 5.0
+    search_weight_content: float = 1.0
+    search_weight_tag_data: float = 3.0
+
+    # Optional boosts blended into the bm25 score; 0 disables them
+    search_interestingness_boost: float = 0.0
+    search_recency_boost: float = 0.0
+    search_recency_half_life_days: float = 365.0
+
+    # Embeddings for `mode=hybrid` searches. `embedder` is `hashing`,
+    # `hashing-<dim>` or `llm:<embedding model id>`; the index lives next to
+    # the database unless `vector_index_path` names a directory.
+    vector_search_enabled: bool = True
+    embedder: str = "hashing"
+    vector_index_path: Optional[str] = None
+    hybrid_candidates: int = 100
+    hybrid_rrf_k: int = 60
+    hybrid_min_similarity: float = 0.0
+
+    # Estimated search totals stop counting at this many matches
+    search_count_cap: int = 1000
+
+    # In-process caches for search totals and result pages
+    search_count_cache_max_entries: int = 1024
+    search_cache_max_entries: int = 512
+    search_cache_max_bytes: int = 16 * 1024 * 1024
+
     class Config:
         env_file = ".env"
         extra = "ignore"
@@ -0,0 +1,234 @@
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+# documentfts is an external-content table over the documentftscontent
+# view: the document text is read from `document`, and only tag_data, which
+# has no column there, is stored separately in documentftstags. Removing a
+# row from the index needs the values it was indexed with, which the view
+# supplies as long as documentftstags is only changed while reindexing.
+# A documentftstags row also marks its document as indexed: new documents
+# are only queued by their insert trigger, and must not be 'delete'd from
+# the index until they have been added to it.
+
+# Text indexed as a document's tag_data: its tags' names and descriptions
+TAG_DATA_SQL = """
+    COALESCE(
+        (
+            SELECT GROUP_CONCAT(t.name || ' ' || COALESCE(t.description, ''), ' ')
+            FROM tag t
+            JOIN documenttag dt ON dt.tag_id = t.id
+            WHERE dt.document_id = d.id
+        ),
+        ''
+    )
+"""
+
+
+def index_documents(connection, where: str, params: dict = {}) -> None:
+    """
+    Store the tag_data of the documents matching `where` (a condition on
+    `d`) and add them to documentfts. They must not be indexed already.
+    """
+    connection.execute(
+        text(
+            f"""
+            INSERT OR REPLACE INTO documentftstags (document_id, tag_data)
+            SELECT d.id, {TAG_DATA_SQL}
+            FROM document d
+            WHERE {where}
+            """
+        ),
+        params,
+    )
+    connection.execute(
+        text(
+            f"""
+            INSERT INTO documentfts(rowid, title, description, content, tag_data)
+            SELECT d.id, d.title, d.description, d.content, d.tag_data
+            FROM documentftscontent d
+            WHERE {where}
+            """
+        ),
+        params,
+    )
+
+
+def flush_dirty_documents(connection) -> int:
+    """
+    Build the FTS row of every document queued in `documentftsdirty` by the
+    document and tag triggers, once each, and empty the queue. Returns the
+    number of documents queued.
+    """
+    queued = connection.execute(text("SELECT COUNT(*) FROM documentftsdirty")).scalar()
+    if not queued:
+        return 0
+    connection.execute(
+        text(
+            """
+            INSERT INTO documentfts(documentfts, rowid, title, description, content, tag_data)
+            SELECT 'delete', d.id, d.title, d.description, d.content, d.tag_data
+            FROM documentftscontent d
+            WHERE d.id IN (SELECT document_id FROM documentftsdirty)
+            AND d.id IN (SELECT document_id FROM documentftstags)
+            """
+        )
+    )
+    index_documents(connection, "d.id IN (SELECT document_id FROM documentftsdirty)")
+    connection.execute(text("DELETE FROM documentftsdirty"))
+    return queued
+
+
+@event.listens_for(Session, "before_commit")
+def _flush_dirty_documents(session):
+    """
+    Index documents added, or whose tags changed, in this transaction
+    before it commits, so searches never see missing rows or stale tag_data
+    """
+    session.flush()
+    flush_dirty_documents(session.connection())
+
+
+# Key of the documentfts_data row holding the index structure: the segments
+# (b-trees) on each level of the log-structured merge tree
+STRUCTURE_ROWID = 10
+STRUCTURE_V2 = b"\xff\x00\x00\x01"
+
+# FTS5's defaults, reported when automerge/crisismerge have never been set
+DEFAULT_AUTOMERGE = 4
+DEFAULT_CRISISMERGE = 16
+
+
+def _varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """Decode the SQLite varint at `pos`; return it and the position after it"""
+    value = 0
+    for _ in range(8):
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos
+    return (value << 8) | data[pos], pos + 1
+
+
+def _structure(connection) -> Optional[bytes]:
+    return connection.execute(
+        text("SELECT block FROM documentfts_data WHERE id = :id"),
+        {"id": STRUCTURE_ROWID},
+    ).scalar()
+
+
+def index_levels(connection) -> Optional[List[int]]:
+    """
+    Return the number of segments on each level of documentfts, or None if
+    the structure record isn't in a format this understands. The format is
+    internal to FTS5, so callers must cope with None.
+    """
+    block = _structure(connection)
+    if not block:
+        return []
+    try:
+        # A 4 byte cookie, then an optional version marker (SQLite 3.44+
+        # adds five varints per segment when it is present)
+        v2 = block[4:8] == STRUCTURE_V2
+        pos = 8 if v2 else 4
+        level_count, pos = _varint(block, pos)
+        _, pos = _varint(block, pos)  # segment count
+        _, pos = _varint(block, pos)  # write counter
+        if v2:
+            _, pos = _varint(block, pos)  # origin counter
+        levels = []
+        for _ in range(level_count):
+            _, pos = _varint(block, pos)  # segments being merged
+            segment_count, pos = _varint(block, pos)
+            for _ in range(segment_count * (8 if v2 else 3)):
+                _, pos = _varint(block, pos)
+            levels.append(segment_count)
+    except IndexError:
+        return None
+    # Anything left over means the layout wasn't what we expected
+    return levels if pos == len(block) else None
+
+
+def segment_count(connection) -> int:
+    """The number of segments in documentfts, with or without index_levels"""
+    levels = index_levels(connection)
+    if levels is not None:
+        return sum(levels)
+    return connection.execute(
+        text("SELECT COUNT(DISTINCT segid) FROM documentfts_idx")
+    ).scalar()
+
+
+def configure_index(connection, automerge: int, crisismerge: int) -> None:
+    """Store the automerge and crisismerge options in documentfts"""
+    for option, value in (("automerge", automerge), ("crisismerge", crisismerge)):
+        connection.execute(
+            text("INSERT INTO documentfts(documentfts, rank) VALUES (:option, :value)"),
+            {"option": option, "value": value},
+        )
+
+
+def merge_index(connection, pages: int) -> bool:
+    """
+    Merge documentfts segments, across levels, until about `pages` pages
+    have been written: an incremental 'optimize' that repeated calls finish.
+    Returns whether there was anything to merge.
+    """
+    before = _structure(connection)
+    connection.execute(
+        text("INSERT INTO documentfts(documentfts, rank) VALUES ('merge', :pages)"),
+        {"pages": -pages},
+    )
+    # Any merge rewrites the structure record; compared, not decoded
+    if _structure(connection) == before:
+        return False
+    operations = ["merge"]
+    if segment_count(connection) <= 1:
+        operations.append("optimize")
+    ran_at = datetime.now(timezone.utc).isoformat()
+    for operation in operations:
+        connection.execute(
+            text(
+                "INSERT OR REPLACE INTO documentftsmaintenance (operation, ran_at) "
+                "VALUES (:operation, :ran_at)"
+            ),
+            {"operation": operation, "ran_at": ran_at},
+        )
+    return True
+
+
+def index_stats(connection) -> dict:
+    """
+    Report the segments on each level of documentfts (levels is None if
+    they can't be read, while the segment total is always there), the size
+    of its segment data, its merge options and when it was last merged and
+    last left fully merged ("optimized")
+    """
+    levels = index_levels(connection)
+    config = dict(
+        connection.execute(
+            text(
+                "SELECT k, v FROM documentfts_config "
+                "WHERE k IN ('automerge', 'crisismerge')"
+            )
+        ).all()
+    )
+    ran_at = dict(
+        connection.execute(
+            text("SELECT operation, ran_at FROM documentftsmaintenance")
+        ).all()
+    )
+    return {
+        "levels": levels,
+        "segments": sum(levels) if levels is not None else segment_count(connection),
+        "index_bytes": connection.execute(
+            text("SELECT COALESCE(SUM(LENGTH(block)), 0) FROM documentfts_data")
+        ).scalar(),
+        "automerge": config.get("automerge", DEFAULT_AUTOMERGE),
+        "crisismerge": config.get("crisismerge", DEFAULT_CRISISMERGE),
+        "last_merged_at": ran_at.get("merge"),
+        "last_optimized_at": ran_at.get("optimize"),
+    }
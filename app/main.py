@@ -1,14 +1,26 @@
-from typing import Annotated, List
+from typing import Annotated, Iterable, Iterator, List, Literal, Optional
 from pathlib import Path
-from datetime import datetime
-from fastapi import FastAPI, Depends, HTTPException, Security, Query
+from datetime import datetime, timezone
+import asyncio
+import base64
+import itertools
+import json
+import re
+import zlib
+from fastapi import FastAPI, Depends, HTTPException, Security, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi.security.api_key import APIKeyHeader
 from contextlib import asynccontextmanager
 from sqlmodel import Session, SQLModel, create_engine, select, func
-from sqlalchemy import text
+from sqlalchemy import text, column, insert, Float, String
+from sqlalchemy.exc import OperationalError
+from pydantic import ValidationError
 
 from .models import (
+    BulkCreateResponse,
+    BulkDocumentResult,
     Tag,
     Document,
     TagCreate,
@@ -16,12 +28,29 @@ from .models import (
     DocumentCreate,
     DocumentRead,
     DocumentTag,
+    FtsIndexStats,
+    FtsMergeResponse,
     TagWithCount,
     DocumentAddTags,
     DocumentSearchResult,
+    SearchBatchRequest,
+    SearchBatchResponse,
+    SearchFacets,
     SearchResponse,
+    SearchSpec,
+    TagFacet,
 )
 from .config import get_settings
+from . import fts  # also reindexes documents with changed tags on commit
+from .tags import tag_resolver
+from .vectors import semantic_search, store_embeddings
+from .cache import (
+    search_count_cache,
+    search_result_cache,
+    sync_search_caches,
+    invalidate_search_caches,
+    cache_stats,
+)
 
 
 # Load API description from markdown file
@@ -30,11 +59,25 @@ with open(description_path, "r") as f:
     description = f.read()
 
 
+async def _maintain_fts_index(interval: float):
+    """Merge documentfts segments every `interval` seconds, in bounded steps"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(_merge_fts_index, get_settings().fts_merge_pages)
+        except Exception as e:
+            print(f"FTS index maintenance failed: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup event
     create_db_and_tables()  # Ensure this runs on app startup
+    interval = get_settings().fts_maintenance_interval_seconds
+    maintenance = asyncio.create_task(_maintain_fts_index(interval)) if interval > 0 else None
     yield  # Run app
+    if maintenance:
+        maintenance.cancel()
 
 
 servers = [{"url": "https://crumpet.bacon.boutique", "description": "Main server"}]
@@ -55,49 +98,103 @@ from .admin import setup_admin
 setup_admin(app, engine)
 
 
+# Tables whose rows can change search results
+SEARCHABLE_TABLES = ("document", "tag", "documenttag", "documentembedding")
+
+
 def create_db_and_tables(db_engine=engine):
     # Create regular tables
     SQLModel.metadata.create_all(db_engine)
 
-    # Create FTS5 virtual table
+    # Create FTS5 virtual table, with prefix indexes so `tof*` queries don't
+    # scan a range of the term index. It is an external-content table over a
+    # view of `document` plus the stored tag_data, so document text isn't
+    # stored twice (see app/fts.py).
+    prefix = " ".join(str(int(n)) for n in get_settings().fts_prefix_lengths)
     with Session(db_engine) as session:
         session.exec(
             text(
                 """
-            CREATE VIRTUAL TABLE IF NOT EXISTS documentfts 
+            CREATE TABLE IF NOT EXISTS documentftstags (
+                document_id INTEGER NOT NULL PRIMARY KEY,
+                tag_data TEXT NOT NULL
+            )
+        """
+            )
+        )
+
+        session.exec(
+            text(
+                """
+            CREATE VIEW IF NOT EXISTS documentftscontent AS
+            SELECT
+                d.id AS id,
+                d.title AS title,
+                COALESCE(d.description, '') AS description,
+                d.content AS content,
+                COALESCE(t.tag_data, '') AS tag_data
+            FROM document d
+            LEFT JOIN documentftstags t ON t.document_id = d.id
+        """
+            )
+        )
+
+        session.exec(
+            text(
+                f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS documentfts
             USING fts5(
-                title, 
-                description, 
+                title,
+                description,
                 content,
                 tag_data,
-                interestingness
+                content='documentftscontent',
+                content_rowid='id',
+                prefix='{prefix}'
+            )
+        """
+            )
+        )
+
+        settings = get_settings()
+        fts.configure_index(
+            session.connection(), settings.fts_automerge, settings.fts_crisismerge
+        )
+
+        # When documentfts was last merged and last left as one segment, for
+        # GET /fts/stats
+        session.exec(
+            text(
+                """
+            CREATE TABLE IF NOT EXISTS documentftsmaintenance (
+                operation TEXT NOT NULL PRIMARY KEY,
+                ran_at TEXT NOT NULL
+            )
+        """
+            )
+        )
+
+        # Create triggers to keep FTS index updated. New documents and tag
+        # changes only queue the affected documents; their FTS rows are built
+        # once per transaction by app.fts.flush_dirty_documents, which also
+        # stores their tag_data. Indexed rows (those with tag_data stored)
+        # are removed with the 'delete' command and the values they were
+        # indexed with.
+        session.exec(
+            text(
+                """
+            CREATE TABLE IF NOT EXISTS documentftsdirty (
+                document_id INTEGER NOT NULL PRIMARY KEY
             )
         """
             )
         )
 
-        # Create triggers to keep FTS index updated
         session.exec(
             text(
                 """
             CREATE TRIGGER IF NOT EXISTS document_ai AFTER INSERT ON document BEGIN
-                INSERT INTO documentfts(rowid, title, description, content, tag_data, interestingness)
-                VALUES (
-                    new.id, 
-                    new.title, 
-                    COALESCE(new.description, ''),
-                    new.content, 
-                    COALESCE(
-                        (
-                            SELECT GROUP_CONCAT(t.name || ' ' || COALESCE(t.description, ''), ' ')
-                            FROM tag t
-                            JOIN documenttag dt ON dt.tag_id = t.id
-                            WHERE dt.document_id = new.id
-                        ),
-                        ''
-                    ),
-                    CAST(new.interestingness AS TEXT)
-                );
+                INSERT OR IGNORE INTO documentftsdirty (document_id) VALUES (new.id);
             END;
         """
             )
@@ -106,8 +203,22 @@ def create_db_and_tables(db_engine=engine):
         session.exec(
             text(
                 """
-            CREATE TRIGGER IF NOT EXISTS document_ad AFTER DELETE ON document BEGIN
-                DELETE FROM documentfts WHERE rowid = old.id;
+            CREATE TRIGGER IF NOT EXISTS document_ad AFTER DELETE ON document
+            WHEN EXISTS (SELECT 1 FROM documentftstags WHERE document_id = old.id)
+            BEGIN
+                INSERT INTO documentfts(documentfts, rowid, title, description, content, tag_data)
+                VALUES (
+                    'delete',
+                    old.id,
+                    old.title,
+                    COALESCE(old.description, ''),
+                    old.content,
+                    COALESCE(
+                        (SELECT tag_data FROM documentftstags WHERE document_id = old.id),
+                        ''
+                    )
+                );
+                DELETE FROM documentftstags WHERE document_id = old.id;
             END;
         """
             )
@@ -116,25 +227,26 @@ def create_db_and_tables(db_engine=engine):
         session.exec(
             text(
                 """
-            CREATE TRIGGER IF NOT EXISTS document_au AFTER UPDATE ON document BEGIN
-                DELETE FROM documentfts WHERE rowid = old.id;
-                INSERT INTO documentfts(rowid, title, description, content, tag_data, interestingness)
+            CREATE TRIGGER IF NOT EXISTS document_au
+            AFTER UPDATE OF title, description, content ON document
+            WHEN EXISTS (SELECT 1 FROM documentftstags WHERE document_id = old.id)
+            BEGIN
+                INSERT INTO documentfts(documentfts, rowid, title, description, content, tag_data)
                 VALUES (
-                    new.id, 
-                    new.title, 
-                    COALESCE(new.description, ''),
-                    new.content, 
+                    'delete',
+                    old.id,
+                    old.title,
+                    COALESCE(old.description, ''),
+                    old.content,
                     COALESCE(
-                        (
-                            SELECT GROUP_CONCAT(t.name || ' ' || COALESCE(t.description, ''), ' ')
-                            FROM tag t
-                            JOIN documenttag dt ON dt.tag_id = t.id
-                            WHERE dt.document_id = new.id
-                        ),
+                        (SELECT tag_data FROM documentftstags WHERE document_id = old.id),
                         ''
-                    ),
-                    CAST(new.interestingness AS TEXT)
+                    )
                 );
+                INSERT INTO documentfts(rowid, title, description, content, tag_data)
+                SELECT id, title, description, content, tag_data
+                FROM documentftscontent
+                WHERE id = new.id;
             END;
         """
             )
@@ -144,17 +256,7 @@ def create_db_and_tables(db_engine=engine):
             text(
                 """
             CREATE TRIGGER IF NOT EXISTS documenttag_ai AFTER INSERT ON documenttag BEGIN
-                UPDATE documentfts 
-                SET tag_data = COALESCE(
-                    (
-                        SELECT GROUP_CONCAT(t.name || ' ' || COALESCE(t.description, ''), ' ')
-                        FROM tag t
-                        JOIN documenttag dt ON dt.tag_id = t.id
-                        WHERE dt.document_id = new.document_id
-                    ),
-                    ''
-                )
-                WHERE rowid = new.document_id;
+                INSERT OR IGNORE INTO documentftsdirty (document_id) VALUES (new.document_id);
             END;
         """
             )
@@ -164,24 +266,180 @@ def create_db_and_tables(db_engine=engine):
             text(
                 """
             CREATE TRIGGER IF NOT EXISTS documenttag_ad AFTER DELETE ON documenttag BEGIN
-                UPDATE documentfts 
-                SET tag_data = COALESCE(
-                    (
-                        SELECT GROUP_CONCAT(t.name || ' ' || COALESCE(t.description, ''), ' ')
-                        FROM tag t
-                        JOIN documenttag dt ON dt.tag_id = t.id
-                        WHERE dt.document_id = old.document_id
-                    ),
-                    ''
-                )
-                WHERE rowid = old.document_id;
+                INSERT OR IGNORE INTO documentftsdirty (document_id) VALUES (old.document_id);
+            END;
+        """
+            )
+        )
+
+        session.exec(
+            text(
+                """
+            CREATE TRIGGER IF NOT EXISTS tag_au AFTER UPDATE OF name, description ON tag BEGIN
+                INSERT OR IGNORE INTO documentftsdirty (document_id)
+                SELECT document_id FROM documenttag WHERE tag_id = new.id;
+            END;
+        """
+            )
+        )
+
+        session.exec(
+            text(
+                """
+            CREATE TRIGGER IF NOT EXISTS tag_ad AFTER DELETE ON tag BEGIN
+                INSERT OR IGNORE INTO documentftsdirty (document_id)
+                SELECT document_id FROM documenttag WHERE tag_id = old.id;
+            END;
+        """
+            )
+        )
+
+        session.exec(
+            text(
+                """
+            CREATE TRIGGER IF NOT EXISTS document_embedding_ad AFTER DELETE ON document BEGIN
+                DELETE FROM documentembedding WHERE document_id = old.id;
+            END;
+        """
+            )
+        )
+
+        # Embedding versions come from a counter that never goes back, and
+        # deleted embeddings are logged under a version of their own, so
+        # app.vectors.VectorIndex.sync sees every change exactly once
+        session.exec(
+            text(
+                """
+            CREATE TABLE IF NOT EXISTS embeddingversion (
+                id INTEGER NOT NULL PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            )
+        """
+            )
+        )
+        session.exec(
+            text(
+                """
+            INSERT OR IGNORE INTO embeddingversion (id, version)
+            SELECT 1, COALESCE(MAX(version), 0) FROM documentembedding
+        """
+            )
+        )
+        session.exec(
+            text(
+                """
+            CREATE TABLE IF NOT EXISTS documentembeddingdeleted (
+                version INTEGER NOT NULL PRIMARY KEY,
+                document_id INTEGER NOT NULL
+            )
+        """
+            )
+        )
+        session.exec(
+            text(
+                """
+            CREATE TRIGGER IF NOT EXISTS documentembedding_ad AFTER DELETE ON documentembedding BEGIN
+                UPDATE embeddingversion SET version = version + 1;
+                INSERT INTO documentembeddingdeleted (version, document_id)
+                SELECT version, old.document_id FROM embeddingversion;
             END;
         """
             )
         )
+
+        # Every change to searchable data bumps searchdataversion, so the
+        # search caches also notice writes made by other processes (imports,
+        # embedding backfills); see app.cache.sync_search_caches
+        session.exec(
+            text(
+                """
+            CREATE TABLE IF NOT EXISTS searchdataversion (
+                id INTEGER NOT NULL PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            )
+        """
+            )
+        )
+        session.exec(
+            text("INSERT OR IGNORE INTO searchdataversion (id, version) VALUES (1, 0)")
+        )
+        for table in SEARCHABLE_TABLES:
+            for suffix, operation in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE")):
+                session.exec(
+                    text(
+                        f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_version_{suffix}
+            AFTER {operation} ON {table} BEGIN
+                UPDATE searchdataversion SET version = version + 1;
+            END;
+        """
+                    )
+                )
+
+        if settings.fts_trigram_enabled:
+            _create_trigram_index(session)
         session.commit()
 
 
+def _create_trigram_index(session: Session):
+    """
+    Secondary trigram index over document text for substring matching. It is
+    an external-content table reading from `document`, so the text isn't
+    stored a second time.
+    """
+    session.exec(
+        text(
+            """
+        CREATE VIRTUAL TABLE IF NOT EXISTS documentfts_trigram
+        USING fts5(
+            title,
+            description,
+            content,
+            content='document',
+            content_rowid='id',
+            tokenize='trigram'
+        )
+    """
+        )
+    )
+
+    session.exec(
+        text(
+            """
+        CREATE TRIGGER IF NOT EXISTS document_trigram_ai AFTER INSERT ON document BEGIN
+            INSERT INTO documentfts_trigram(rowid, title, description, content)
+            VALUES (new.id, new.title, new.description, new.content);
+        END;
+    """
+        )
+    )
+
+    session.exec(
+        text(
+            """
+        CREATE TRIGGER IF NOT EXISTS document_trigram_ad AFTER DELETE ON document BEGIN
+            INSERT INTO documentfts_trigram(documentfts_trigram, rowid, title, description, content)
+            VALUES ('delete', old.id, old.title, old.description, old.content);
+        END;
+    """
+        )
+    )
+
+    session.exec(
+        text(
+            """
+        CREATE TRIGGER IF NOT EXISTS document_trigram_au
+        AFTER UPDATE OF title, description, content ON document BEGIN
+            INSERT INTO documentfts_trigram(documentfts_trigram, rowid, title, description, content)
+            VALUES ('delete', old.id, old.title, old.description, old.content);
+            INSERT INTO documentfts_trigram(rowid, title, description, content)
+            VALUES (new.id, new.title, new.description, new.content);
+        END;
+    """
+        )
+    )
+
+
 def get_session():
     with Session(engine) as session:
         yield session
@@ -245,10 +503,468 @@ def update_tag_description(
     tag.description = tag_data.description
     session.add(tag)
     session.commit()
+    invalidate_search_caches()
     session.refresh(tag)
     return tag
 
 
+# Indexed columns of each FTS table, in order, for bm25() weights
+FTS_COLUMNS = {
+    "documentfts": ["title", "description", "content", "tag_data"],
+    "documentfts_trigram": ["title", "description", "content"],
+}
+
+
+def _search_rank_sql(settings, now: str, fts_table: str) -> tuple[str, dict]:
+    """
+    Build the ranking expression for FTS searches: column-weighted bm25,
+    optionally scaled up by interestingness and recency. As with bm25,
+    lower scores are better.
+    """
+    weights = ", ".join(f":w_{name}" for name in FTS_COLUMNS[fts_table])
+    rank = (
+        f"bm25({fts_table}, {weights})"
+        " * (1.0"
+        " + :interestingness_boost * COALESCE(document.interestingness, 0)"
+        " + :recency_boost / (1.0 + MAX(julianday(:now) - julianday(document.created_at), 0.0)"
+        " / :recency_half_life_days))"
+    )
+    params = {
+        "now": now,
+        "w_title": settings.search_weight_title,
+        "w_description": settings.search_weight_description,
+        "w_content": settings.search_weight_content,
+        "w_tag_data": settings.search_weight_tag_data,
+        "interestingness_boost": settings.search_interestingness_boost,
+        "recency_boost": settings.search_recency_boost,
+        "recency_half_life_days": settings.search_recency_half_life_days,
+    }
+    return rank, params
+
+
+def _encode_cursor(
+    sort: str, mode: str, score: float | str, document_id: int, now: str
+) -> str:
+    """
+    Encode the position after the last result of a page: its score, or its
+    created_at when sorting by date. The reference time is carried along so
+    recency boosts score identically on every page, and the sort and mode
+    so the cursor can't be replayed against a different ordering.
+    """
+    payload = json.dumps([sort, mode, score, document_id, now]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def _decode_cursor(cursor: str, sort: str, mode: str) -> tuple[float | str, int, str]:
+    try:
+        cursor_sort, cursor_mode, score, document_id, now = json.loads(
+            base64.urlsafe_b64decode(cursor)
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if (cursor_sort, cursor_mode) != (sort, mode):
+        raise HTTPException(
+            status_code=400, detail="Cursor belongs to a search with another sort or mode"
+        )
+    try:
+        score = str(score) if sort == "created_at" else float(score)
+        return score, int(document_id), str(now)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _tags_by_document(session: Session, document_ids: List[int]) -> dict:
+    """
+    Fetch the tags of many documents in one query, keyed by document id
+    """
+    if not document_ids:
+        return {}
+    rows = session.exec(
+        select(DocumentTag.document_id, Tag)
+        .join(Tag, Tag.id == DocumentTag.tag_id)
+        .where(DocumentTag.document_id.in_(document_ids))
+        .order_by(DocumentTag.document_id, Tag.id)
+    ).all()
+    tags = {}
+    for document_id, tag in rows:
+        tags.setdefault(document_id, []).append(tag)
+    return tags
+
+
+def _tag_filter_sql(tag_ids: List[int], exclude_tag_ids: List[int]) -> str:
+    """
+    Build WHERE conditions restricting `document` by its tag links. The ids
+    are validated ints, so they are inlined rather than bound.
+    """
+    sql = ""
+    if tag_ids:
+        ids = ", ".join(str(int(tag_id)) for tag_id in tag_ids)
+        sql += f"""
+            AND document.id IN (
+                SELECT document_id FROM documenttag
+                WHERE tag_id IN ({ids})
+                GROUP BY document_id
+                HAVING COUNT(*) = {len(tag_ids)}
+            )
+        """
+    if exclude_tag_ids:
+        ids = ", ".join(str(int(tag_id)) for tag_id in exclude_tag_ids)
+        sql += f"""
+            AND NOT EXISTS (
+                SELECT 1 FROM documenttag
+                WHERE document_id = document.id AND tag_id IN ({ids})
+            )
+        """
+    return sql
+
+
+def _sql_datetime(value: datetime) -> str:
+    """Format a datetime the way SQLAlchemy stores them in SQLite"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _document_filter_sql(
+    params: dict,
+    min_interestingness: Optional[int] = None,
+    tag_ids: List[int] = [],
+    exclude_tag_ids: List[int] = [],
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+) -> str:
+    """
+    Build WHERE conditions on `document` shared by search and export, adding
+    their bound values to `params`. They are part of the matching query, so
+    they apply before ranking.
+    """
+    sql = ""
+    if min_interestingness is not None:
+        sql += " AND document.interestingness >= :min_interestingness"
+        params["min_interestingness"] = min_interestingness
+    if created_after is not None:
+        sql += " AND document.created_at >= :created_after"
+        params["created_after"] = _sql_datetime(created_after)
+    if created_before is not None:
+        sql += " AND document.created_at < :created_before"
+        params["created_before"] = _sql_datetime(created_before)
+    return sql + _tag_filter_sql(tag_ids, exclude_tag_ids)
+
+
+def _tag_facets(session: Session, hits: str, params: dict) -> List[TagFacet]:
+    """
+    Count how many matching documents carry each tag, in one aggregate
+    query. `hits` is a SELECT returning the matching document ids.
+    """
+    query = f"""
+        SELECT tag.id, tag.name, COUNT(*) AS count
+        FROM ({hits}) AS hit
+        JOIN documenttag ON documenttag.document_id = hit.id
+        JOIN tag ON tag.id = documenttag.tag_id
+        GROUP BY tag.id
+        ORDER BY count DESC, tag.name
+    """
+    rows = session.execute(text(query).params(**params)).all()
+    return [TagFacet(id=id, name=name, count=count) for id, name, count in rows]
+
+
+def _count_search_results(
+    session: Session, from_where: str, params: dict, mode: str, cache_key: tuple
+) -> tuple[Optional[int], bool]:
+    """
+    Count the matches for a search according to `mode`, returning
+    (total, capped). Exact totals are cached until the next write.
+    """
+    if mode == "none":
+        return None, False
+
+    total = search_count_cache.get(cache_key)
+    if total is not None:
+        return total, False
+
+    if mode == "exact":
+        total = session.execute(
+            text(f"SELECT COUNT(*) {from_where}").params(**params)
+        ).scalar()
+        search_count_cache.set(cache_key, total)
+        return total, False
+
+    # Stop scanning one row past the cap; anything below it is still exact
+    cap = get_settings().search_count_cap
+    total = session.execute(
+        text(f"SELECT COUNT(*) FROM (SELECT 1 {from_where} LIMIT :cap)").params(
+            cap=cap + 1, **params
+        )
+    ).scalar()
+    if total > cap:
+        return cap, True
+    search_count_cache.set(cache_key, total)
+    return total, False
+
+
+# Only the columns DocumentSearchResult needs; content can be huge
+SEARCH_RESULT_COLUMNS = """
+    document.id,
+    document.title,
+    document.description,
+    document.interestingness,
+    document.created_at,
+    document.updated_at
+"""
+
+
+def _search_results(
+    session: Session, query: str, params: dict, score_type=Float
+) -> list:
+    """
+    Run a query selecting SEARCH_RESULT_COLUMNS (plus `score`) and return
+    (DocumentSearchResult, score) pairs, with tags loaded in one batch
+    """
+    statement = text(query).columns(
+        Document.id,
+        Document.title,
+        Document.description,
+        Document.interestingness,
+        Document.created_at,
+        Document.updated_at,
+        column("score", score_type),
+    )
+    rows = session.execute(statement.params(**params)).all()
+    tags = _tags_by_document(session, [row.id for row in rows])
+    return [
+        (
+            DocumentSearchResult(
+                id=row.id,
+                title=row.title,
+                description=row.description,
+                interestingness=row.interestingness,
+                created_at=row.created_at,
+                updated_at=row.updated_at,
+                tags=tags.get(row.id, []),
+            ),
+            row.score,
+        )
+        for row in rows
+    ]
+
+
+def _search(session: Session, spec: SearchSpec) -> SearchResponse:
+    """
+    Run one search as described by `spec`; see `search_documents`
+    """
+    # Capture the generation before reading so a concurrent write can't
+    # leave a stale page cached under the new one
+    generation = sync_search_caches(session.connection())
+    # Runs of whitespace mean nothing to FTS5 queries, so they share a cache
+    # entry; substring queries match them literally
+    q = spec.q if spec.mode == "substring" else " ".join(spec.q.split())
+    tag_ids = sorted(set(spec.tag_ids))
+    exclude_tag_ids = sorted(set(spec.exclude_tag_ids))
+    filters = (
+        q,
+        spec.mode,
+        spec.min_interestingness,
+        tuple(tag_ids),
+        tuple(exclude_tag_ids),
+        spec.created_after,
+        spec.created_before,
+    )
+    cache_key = (
+        generation,
+        filters,
+        spec.sort,
+        spec.page,
+        spec.page_size,
+        spec.cursor,
+        spec.count,
+        spec.facets,
+    )
+    cached = search_result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    settings = get_settings()
+    if spec.mode == "substring":
+        if not settings.fts_trigram_enabled:
+            raise HTTPException(
+                status_code=400, detail="Substring search is not enabled"
+            )
+        fts_table = "documentfts_trigram"
+        params = {"query": '"' + q.replace('"', '""') + '"'}
+    elif spec.mode == "hybrid":
+        # Hybrid queries are natural language rather than FTS5 syntax: match
+        # any of their words, each quoted
+        fts_table = "documentfts"
+        params = {"query": " OR ".join(f'"{word}"' for word in re.findall(r"\w+", q))}
+    else:
+        fts_table = "documentfts"
+        params = {"query": q}
+
+    # Conditions on `document` alone, shared by every search mode
+    filter_sql = _document_filter_sql(
+        params,
+        spec.min_interestingness,
+        tag_ids,
+        exclude_tag_ids,
+        spec.created_after,
+        spec.created_before,
+    )
+
+    from_where = f"""
+        FROM {fts_table}
+        JOIN document ON document.id = {fts_table}.rowid
+        WHERE {fts_table} MATCH :query
+        {filter_sql}
+    """
+
+    if spec.mode == "hybrid":
+        response = _hybrid_search(session, spec, from_where, filter_sql, params)
+        search_result_cache.set(cache_key, response)
+        return response
+
+    total, total_capped = _count_search_results(
+        session, from_where, params, spec.count, (generation, filters)
+    )
+
+    # Rank, order and paginate in a single pass so the page is the best N.
+    # A cursor resumes after the last (score, id) seen instead of using OFFSET.
+    if spec.sort == "created_at":
+        order, after = "DESC", "<"
+    else:
+        order, after = "ASC", ">"
+    if spec.cursor:
+        after_score, after_id, now = _decode_cursor(spec.cursor, spec.sort, spec.mode)
+        keyset = f"WHERE (score, id) {after} (:after_score, :after_id)"
+        params.update(after_score=after_score, after_id=after_id, offset=0)
+    else:
+        now = datetime.utcnow().isoformat(sep=" ")
+        keyset = ""
+        params["offset"] = (spec.page - 1) * spec.page_size
+
+    if spec.sort == "created_at":
+        score, score_type = "document.created_at", String
+    else:
+        score, rank_params = _search_rank_sql(settings, now, fts_table)
+        score_type = Float
+        params.update(rank_params)
+    query = f"""
+        SELECT * FROM (
+            SELECT {SEARCH_RESULT_COLUMNS}, {score} AS score
+            {from_where}
+        )
+        {keyset}
+        ORDER BY score {order}, id {order}
+        LIMIT :limit OFFSET :offset
+    """
+    params["limit"] = spec.page_size
+    results = _search_results(session, query, params, score_type)
+
+    next_cursor = None
+    if len(results) == spec.page_size:
+        last, last_score = results[-1]
+        next_cursor = _encode_cursor(spec.sort, spec.mode, last_score, last.id, now)
+
+    response = SearchResponse(
+        total=total,
+        total_capped=total_capped,
+        results=[document for document, _ in results],
+        next_cursor=next_cursor,
+    )
+    if spec.facets == "tags":
+        response.facets = SearchFacets(
+            tags=_tag_facets(session, f"SELECT document.id {from_where}", params)
+        )
+    search_result_cache.set(cache_key, response)
+    return response
+
+
+def _hybrid_search(
+    session: Session, spec: SearchSpec, from_where: str, filter_sql: str, params: dict
+) -> SearchResponse:
+    """
+    Fuse the best FTS matches with the most similar embeddings using
+    reciprocal rank fusion: each list adds 1 / (k + rank) to a document's
+    score. Only the top `hybrid_candidates` of each list take part, so this
+    pages with `page` rather than cursors.
+    """
+    settings = get_settings()
+    if not settings.vector_search_enabled:
+        raise HTTPException(status_code=400, detail="Hybrid search is not enabled")
+    if spec.cursor:
+        raise HTTPException(
+            status_code=400, detail="Cursors are not supported by hybrid search"
+        )
+    if spec.sort != "relevance":
+        raise HTTPException(
+            status_code=400, detail="Hybrid search can only sort by relevance"
+        )
+    candidates = settings.hybrid_candidates
+
+    now = datetime.utcnow().isoformat(sep=" ")
+    rank, rank_params = _search_rank_sql(settings, now, "documentfts")
+    fts_ids = []
+    if params["query"]:
+        fts_ids = (
+            session.execute(
+                text(
+                    f"SELECT document.id {from_where} ORDER BY {rank}, document.id LIMIT :n"
+                ).params(n=candidates, **params, **rank_params)
+            )
+            .scalars()
+            .all()
+        )
+
+    # Nearest neighbours ignore the filters, so apply them afterwards
+    similar = [
+        (document_id, similarity)
+        for document_id, similarity in semantic_search(session, spec.q, candidates)
+        if similarity > settings.hybrid_min_similarity
+    ]
+    vector_ids = []
+    if similar:
+        ids = ", ".join(str(document_id) for document_id, _ in similar)
+        allowed = set(
+            session.execute(
+                text(
+                    f"SELECT document.id FROM document WHERE document.id IN ({ids}) {filter_sql}"
+                ).params(**params)
+            ).scalars()
+        )
+        vector_ids = [document_id for document_id, _ in similar if document_id in allowed]
+
+    k = settings.hybrid_rrf_k
+    scores = {}
+    for ranked in (fts_ids, vector_ids):
+        for position, document_id in enumerate(ranked, start=1):
+            scores[document_id] = scores.get(document_id, 0.0) + 1.0 / (k + position)
+    fused = sorted(scores, key=lambda document_id: (-scores[document_id], document_id))
+
+    start = (spec.page - 1) * spec.page_size
+    page_ids = fused[start : start + spec.page_size]
+    results = []
+    if page_ids:
+        ids = ", ".join(str(document_id) for document_id in page_ids)
+        rows = _search_results(
+            session,
+            f"SELECT {SEARCH_RESULT_COLUMNS}, 0.0 AS score FROM document WHERE id IN ({ids})",
+            {},
+        )
+        by_id = {document.id: document for document, _ in rows}
+        results = [by_id[document_id] for document_id in page_ids]
+
+    response = SearchResponse(
+        total=None if spec.count == "none" else len(fused),
+        total_capped=len(fts_ids) == candidates or len(similar) == candidates,
+        results=results,
+    )
+    if spec.facets == "tags" and fused:
+        ids = ", ".join(str(document_id) for document_id in fused)
+        response.facets = SearchFacets(
+            tags=_tag_facets(session, f"SELECT id FROM document WHERE id IN ({ids})", {})
+        )
+    return response
+
+
 @app.get("/documents/search", response_model=SearchResponse)
 def search_documents(
     session: SessionDep,
@@ -257,14 +973,167 @@ def search_documents(
     min_interestingness: int = Query(None, ge=0, le=2),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    count: Literal["exact", "estimated", "none"] = Query("estimated"),
+    mode: Literal["fts", "substring", "hybrid"] = Query("fts"),
+    tag_ids: List[int] = Query([]),
+    exclude_tag_ids: List[int] = Query([]),
+    facets: Optional[Literal["tags"]] = Query(None),
+    created_after: Optional[datetime] = Query(None),
+    created_before: Optional[datetime] = Query(None),
+    sort: Literal["relevance", "created_at"] = Query("relevance"),
+):
+    """
+    Search documents using FTS5, best matches first.
+
+    Pass the `next_cursor` of a response as `cursor` to fetch the following
+    page; this is cheaper than `page` for deep result sets.
+
+    `count` controls how `total` is computed: `exact` counts every match,
+    `estimated` stops counting at a cap and sets `total_capped`, and `none`
+    skips counting altogether.
+
+    `mode=substring` matches `q` literally anywhere in the title,
+    description or content (case-insensitively) using the trigram index,
+    instead of as an FTS5 query string. `mode=hybrid` blends FTS5 ranking
+    with semantic similarity, finding documents that discuss the same topic
+    in different words; it pages with `page` only.
+
+    `tag_ids` keeps only documents carrying all of the given tags and
+    `exclude_tag_ids` drops documents carrying any of them. `facets=tags`
+    adds per-tag hit counts over the whole result set.
+
+    `created_after` (inclusive) and `created_before` (exclusive) restrict
+    results by creation time. `sort=created_at` lists matches newest first
+    instead of by relevance.
+    """
+    spec = SearchSpec(
+        q=q,
+        min_interestingness=min_interestingness,
+        page=page,
+        page_size=page_size,
+        cursor=cursor,
+        count=count,
+        mode=mode,
+        tag_ids=tag_ids,
+        exclude_tag_ids=exclude_tag_ids,
+        facets=facets,
+        created_after=created_after,
+        created_before=created_before,
+        sort=sort,
+    )
+    return _search(session, spec)
+
+
+@app.post("/documents/search/batch", response_model=SearchBatchResponse)
+def search_documents_batch(
+    batch: SearchBatchRequest, session: SessionDep, _: APIKeyDep
+):
+    """
+    Run several searches in one request, taking the same options as
+    `/documents/search`. With `deduplicate`, a document is only returned by
+    the first search that finds it.
+    """
+    responses = []
+    seen = set()
+    for spec in batch.searches:
+        response = _search(session, spec)
+        if batch.deduplicate:
+            # Cached responses are shared, so filter a copy
+            results = [doc for doc in response.results if doc.id not in seen]
+            seen.update(doc.id for doc in results)
+            response = response.model_copy(update={"results": results})
+        responses.append(response)
+    return SearchBatchResponse(responses=responses)
+
+
+# Documents read per transaction by /documents/export
+EXPORT_BATCH_SIZE = 500
+
+
+def _export_batches(query: str, params: dict) -> Iterator[List[DocumentRead]]:
+    """
+    Yield the documents matching `query` in id order, EXPORT_BATCH_SIZE at a
+    time. Each batch is read in its own short transaction, resuming after
+    the last id seen, so a long export never keeps writers waiting on a
+    read transaction. Uses its own sessions because it runs while the
+    response is being sent.
+    """
+    statement = text(query).columns(
+        Document.id,
+        Document.title,
+        Document.description,
+        Document.content,
+        Document.interestingness,
+        Document.created_at,
+        Document.updated_at,
+    )
+    last_id = 0
+    while True:
+        with Session(engine) as session:
+            rows = session.execute(
+                statement.params(**params, last_id=last_id, limit=EXPORT_BATCH_SIZE)
+            ).all()
+            tags = _tags_by_document(session, [row.id for row in rows])
+        yield [DocumentRead(**row._asdict(), tags=tags.get(row.id, [])) for row in rows]
+        if len(rows) < EXPORT_BATCH_SIZE:
+            return
+        last_id = rows[-1].id
+
+
+def _export_lines(batches: Iterable[List[DocumentRead]]):
+    """Yield one JSON line per document"""
+    for batch in batches:
+        for document in batch:
+            yield document.model_dump_json() + "\n"
+
+
+def _gzip_lines(lines):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for line in lines:
+        chunk = compressor.compress(line.encode())
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+@app.get("/documents/export")
+def export_documents(
+    _: APIKeyDep,
+    q: Optional[str] = Query(None, min_length=3),
+    min_interestingness: int = Query(None, ge=0, le=2),
+    tag_ids: List[int] = Query([]),
+    exclude_tag_ids: List[int] = Query([]),
+    created_after: Optional[datetime] = Query(None),
+    created_before: Optional[datetime] = Query(None),
+    gzip: bool = Query(False),
 ):
     """
-    Search documents using FTS5
+    Stream documents, including their content and tags, as NDJSON in id
+    order. Without `q` the whole corpus is exported; the other filters work
+    as in `/documents/search`. `gzip=true` compresses the stream.
     """
-    # Build the FTS query
-    # Build query that joins Document with FTS results to preserve ranking
-    query = """
-        SELECT 
+    params = {}
+    if q:
+        from_where = """
+            FROM documentfts
+            JOIN document ON document.id = documentfts.rowid
+            WHERE documentfts MATCH :query
+        """
+        params["query"] = q
+    else:
+        from_where = "FROM document WHERE 1 = 1"
+    from_where += _document_filter_sql(
+        params,
+        min_interestingness,
+        sorted(set(tag_ids)),
+        sorted(set(exclude_tag_ids)),
+        created_after,
+        created_before,
+    )
+
+    query = f"""
+        SELECT
             document.id,
             document.title,
             document.description,
@@ -272,44 +1141,26 @@ def search_documents(
             document.interestingness,
             document.created_at,
             document.updated_at
-        FROM documentfts
-        JOIN document ON document.id = documentfts.rowid 
-        WHERE documentfts MATCH :query
-    """
-    params = {"query": q}
-
-    if min_interestingness is not None:
-        query += " AND CAST(documentfts.interestingness AS INTEGER) >= :min_interestingness"
-        params["min_interestingness"] = min_interestingness
-
-    # Get total count first
-    count_query = f"""
-        SELECT COUNT(*) 
-        FROM documentfts
-        JOIN document ON document.id = documentfts.rowid 
-        WHERE documentfts MATCH :query
+        {from_where}
+        AND document.id > :last_id
+        ORDER BY document.id
+        LIMIT :limit
     """
-    if min_interestingness is not None:
-        count_query += " AND CAST(documentfts.interestingness AS INTEGER) >= :min_interestingness"
-    
-    total = session.execute(text(count_query).params(**params)).scalar()
-
-    # Add pagination to main query
-    query += " LIMIT :limit OFFSET :offset"
-    params["limit"] = page_size
-    params["offset"] = (page - 1) * page_size
-
-    # Execute joined query that maintains FTS ranking order
-    result = session.exec(
-        select(Document).where(Document.id.in_(
-            session.execute(text(query).params(**params)).scalars()
-        ))
-    ).all()
-    
-    # Convert Document objects to DocumentRead models
-    documents = [DocumentRead.model_validate(doc) for doc in result]
-
-    return SearchResponse(total=total, results=documents)
+    # Read the first batch before the response starts, while errors can
+    # still be reported with a status code
+    batches = _export_batches(query, params)
+    try:
+        first = next(batches)
+    except OperationalError:
+        raise HTTPException(status_code=400, detail="Invalid search query")
+    lines = _export_lines(itertools.chain([first], batches))
+    if gzip:
+        return StreamingResponse(
+            _gzip_lines(lines),
+            media_type="application/x-ndjson",
+            headers={"Content-Encoding": "gzip"},
+        )
+    return StreamingResponse(lines, media_type="application/x-ndjson")
 
 
 @app.get("/documents/{document_id}", response_model=DocumentRead)
@@ -347,6 +1198,7 @@ def add_tags_to_document(
 
     session.add(document)
     session.commit()
+    invalidate_search_caches()
     session.refresh(document)
     return document
 
@@ -367,6 +1219,13 @@ def create_document(document_data: DocumentCreate, session: SessionDep, _: APIKe
     else:
         tags = []
 
+    if document_data.tag_names:
+        name_ids = tag_resolver.resolve(
+            session.connection(), dict.fromkeys(document_data.tag_names)
+        )
+        new_ids = set(name_ids.values()) - {tag.id for tag in tags}
+        tags += session.exec(select(Tag).where(Tag.id.in_(new_ids))).all()
+
     # Create the document
     document = Document(
         title=document_data.title,
@@ -380,17 +1239,181 @@ def create_document(document_data: DocumentCreate, session: SessionDep, _: APIKe
 
     session.add(document)
     session.commit()
+    invalidate_search_caches()
     session.refresh(document)
     return document
 
 
+def _bulk_create_documents(
+    session: Session, items: List[DocumentCreate | str]
+) -> BulkCreateResponse:
+    """
+    Insert many documents and their tag links with two executemany
+    statements in one transaction. Items that failed to parse arrive as
+    their error message and are reported, not inserted.
+    """
+    tag_ids = {
+        tag_id
+        for item in items
+        if isinstance(item, DocumentCreate)
+        for tag_id in item.tag_ids
+    }
+    known_tag_ids = set()
+    if tag_ids:
+        known_tag_ids = set(
+            session.exec(select(Tag.id).where(Tag.id.in_(tag_ids))).all()
+        )
+
+    results = [BulkDocumentResult(index=index) for index in range(len(items))]
+    valid = []
+    for result, item in zip(results, items):
+        if isinstance(item, str):
+            result.error = item
+        elif not known_tag_ids.issuperset(item.tag_ids):
+            result.error = "One or more tag IDs do not exist"
+        else:
+            valid.append((result, item))
+
+    if valid:
+        name_ids = tag_resolver.resolve(
+            session.connection(),
+            dict.fromkeys(name for _, item in valid for name in item.tag_names),
+        )
+        now = datetime.utcnow()
+        rows = [
+            {
+                "title": item.title,
+                "description": item.description,
+                "content": item.content,
+                "interestingness": item.interestingness,
+                "created_at": item.created_at or now,
+                "updated_at": item.updated_at or now,
+            }
+            for _, item in valid
+        ]
+        ids = session.execute(
+            insert(Document).returning(Document.id, sort_by_parameter_order=True),
+            rows,
+        ).scalars().all()
+        links = [
+            {"document_id": document_id, "tag_id": tag_id}
+            for document_id, (_, item) in zip(ids, valid)
+            for tag_id in sorted(
+                set(item.tag_ids) | {name_ids[name] for name in item.tag_names}
+            )
+        ]
+        if links:
+            session.execute(insert(DocumentTag), links)
+        # Core inserts bypass the ORM flush hook that maintains embeddings
+        if get_settings().vector_search_enabled:
+            store_embeddings(
+                session.connection(),
+                (
+                    (document_id, row["title"], row["description"], row["content"])
+                    for document_id, row in zip(ids, rows)
+                ),
+            )
+        session.commit()
+        invalidate_search_caches()
+        for document_id, (result, _) in zip(ids, valid):
+            result.id = document_id
+
+    return BulkCreateResponse(
+        created=len(valid), failed=len(items) - len(valid), results=results
+    )
+
+
+@app.post("/documents/bulk", response_model=BulkCreateResponse)
+async def create_documents_bulk(request: Request, session: SessionDep, _: APIKeyDep):
+    """
+    Create many documents in one transaction. The body is either a JSON
+    array of documents, as accepted by `POST /documents/`, or NDJSON with
+    one document per line (Content-Type `application/x-ndjson`). Each item
+    gets its new id or an error; invalid items, including NDJSON lines that
+    aren't JSON, don't stop the others.
+    """
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+
+    def validate(raw_item) -> DocumentCreate | str:
+        try:
+            return DocumentCreate.model_validate(raw_item)
+        except ValidationError as e:
+            errors = (
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+                for error in e.errors()
+            )
+            return "; ".join(errors)
+
+    items = []
+    if content_type.startswith("application/x-ndjson"):
+        # Each line stands alone, so a malformed one only fails its own item
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                raw_item = json.loads(line)
+            except ValueError as e:
+                items.append(f"Invalid JSON: {e}")
+            else:
+                items.append(validate(raw_item))
+    else:
+        try:
+            raw_items = json.loads(body)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON")
+        if not isinstance(raw_items, list):
+            raise HTTPException(status_code=400, detail="Expected a list of documents")
+        items = [validate(raw_item) for raw_item in raw_items]
+
+    return await run_in_threadpool(_bulk_create_documents, session, items)
+
+
 @app.post("/tags/", response_model=Tag, status_code=201)
 def create_tag(tag_data: TagCreate, session: SessionDep, _: APIKeyDep):
     """
     Create a new tag
     """
+    if session.exec(select(Tag.id).where(Tag.name == tag_data.name)).first():
+        raise HTTPException(status_code=409, detail="Tag already exists")
     tag = Tag(name=tag_data.name, description=tag_data.description)
     session.add(tag)
     session.commit()
+    invalidate_search_caches()
     session.refresh(tag)
     return tag
+
+
+@app.get("/cache/stats")
+def get_cache_stats(_: APIKeyDep):
+    """
+    Report entry counts, sizes and hit/miss counters for the search caches
+    """
+    return cache_stats()
+
+
+def _merge_fts_index(pages: int) -> FtsMergeResponse:
+    with engine.begin() as connection:
+        merged = fts.merge_index(connection, pages)
+        return FtsMergeResponse(merged=merged, **fts.index_stats(connection))
+
+
+@app.get("/fts/stats", response_model=FtsIndexStats)
+def get_fts_stats(session: SessionDep, _: APIKeyDep):
+    """
+    Report the segment counts, size and merge options of the full-text index,
+    and when it was last merged and last fully merged
+    """
+    return fts.index_stats(session.connection())
+
+
+@app.post("/fts/merge", response_model=FtsMergeResponse)
+def merge_fts_index(
+    _: APIKeyDep,
+    pages: Annotated[Optional[int], Query(ge=1)] = None,
+):
+    """
+    Merge full-text index segments until about `pages` pages (default
+    `fts_merge_pages`) have been written, as the background task does
+    """
+    return _merge_fts_index(pages or get_settings().fts_merge_pages)
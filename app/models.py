@@ -1,10 +1,14 @@
-from typing import Optional, List
+from typing import Literal, Optional, List
 from datetime import datetime
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index
 from pydantic import BaseModel
 
 
 class DocumentTag(SQLModel, table=True):
+    # The primary key serves lookups by document; this serves lookups by tag
+    __table_args__ = (Index("ix_documenttag_tag_id", "tag_id", "document_id"),)
+
     document_id: Optional[int] = Field(
         default=None, foreign_key="document.id", primary_key=True
     )
@@ -13,7 +17,7 @@ class DocumentTag(SQLModel, table=True):
 
 class Tag(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    name: str = Field(index=True)
+    name: str = Field(index=True, unique=True)
     description: Optional[str] = None
 
     # Relationships
@@ -52,14 +56,40 @@ class Document(SQLModel, table=True):
     title: str = Field(index=True)
     description: Optional[str] = None
     content: str = Field(default="")
-    interestingness: Optional[int] = Field(default=None)
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    interestingness: Optional[int] = Field(default=None, index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    updated_at: datetime = Field(default_factory=datetime.utcnow, index=True)
 
     # Relationships
     tags: List["Tag"] = Relationship(back_populates="documents", link_model=DocumentTag)
 
 
+class DocumentEmbedding(SQLModel, table=True):
+    document_id: Optional[int] = Field(
+        default=None, foreign_key="document.id", primary_key=True
+    )
+    embedder: str
+    vector: bytes
+    # Increases with every write, so the vector index can sync incrementally
+    version: int = Field(index=True)
+
+
+class ConversationImport(SQLModel, table=True):
+    # One row per imported ChatGPT conversation, so re-imports can skip or
+    # update it instead of creating a duplicate
+    conversation_id: str = Field(primary_key=True)
+    update_time: Optional[float] = None
+    content_hash: str
+    # Set when the conversation was abridged to this many tokens for the model
+    token_budget: Optional[int] = None
+    # Set while the document is interesting but not yet tagged
+    needs_tags: bool = False
+    document_id: Optional[int] = Field(
+        default=None, foreign_key="document.id", index=True
+    )
+    imported_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class DocumentRead(BaseModel):
     id: Optional[int] = None
     title: str
@@ -87,9 +117,47 @@ class DocumentSearchResult(BaseModel):
         from_attributes = True
 
 
+class SearchSpec(BaseModel):
+    q: str = Field(min_length=3)
+    min_interestingness: Optional[int] = Field(default=None, ge=0, le=2)
+    page: int = Field(default=1, ge=1)
+    page_size: int = Field(default=20, ge=1, le=100)
+    cursor: Optional[str] = None
+    count: Literal["exact", "estimated", "none"] = "estimated"
+    mode: Literal["fts", "substring", "hybrid"] = "fts"
+    tag_ids: List[int] = Field(default_factory=list)
+    exclude_tag_ids: List[int] = Field(default_factory=list)
+    facets: Optional[Literal["tags"]] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    sort: Literal["relevance", "created_at"] = "relevance"
+
+
+class TagFacet(BaseModel):
+    id: int
+    name: str
+    count: int
+
+
+class SearchFacets(BaseModel):
+    tags: List[TagFacet] = []
+
+
 class SearchResponse(BaseModel):
-    total: int
+    total: Optional[int] = None
+    total_capped: bool = False
     results: List[DocumentSearchResult]
+    next_cursor: Optional[str] = None
+    facets: Optional[SearchFacets] = None
+
+
+class SearchBatchRequest(BaseModel):
+    searches: List[SearchSpec] = Field(min_length=1, max_length=20)
+    deduplicate: bool = False
+
+
+class SearchBatchResponse(BaseModel):
+    responses: List[SearchResponse]
 
 
 class DocumentCreate(BaseModel):
@@ -98,9 +166,39 @@ class DocumentCreate(BaseModel):
     content: str
     interestingness: Optional[int] = Field(default=None, ge=0, le=2)
     tag_ids: List[int] = Field(default_factory=list)
+    # Tags to attach by name; missing ones are created without a description
+    tag_names: List[str] = Field(default_factory=list)
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
 
+class BulkDocumentResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class BulkCreateResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkDocumentResult]
+
+
 class DocumentAddTags(BaseModel):
     tag_ids: List[int]
+
+
+class FtsIndexStats(BaseModel):
+    # Segment (b-tree) count on each level of documentfts, lowest first;
+    # None when the FTS5 structure record is in a format we can't read
+    levels: Optional[List[int]]
+    segments: int
+    index_bytes: int
+    automerge: int
+    crisismerge: int
+    last_merged_at: Optional[datetime] = None
+    last_optimized_at: Optional[datetime] = None
+
+
+class FtsMergeResponse(FtsIndexStats):
+    merged: bool
@@ -0,0 +1,84 @@
+import threading
+import weakref
+from typing import Dict, Mapping, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Engine
+
+from .cache import write_generation
+from .models import Tag
+
+# Stay well below SQLite's bound parameter limit
+CHUNK_SIZE = 500
+
+# Set in a connection's info while its transaction may have created tags
+CREATED_TAGS = "tag_resolver_created_tags"
+
+
+class TagResolver:
+    """
+    Maps tag names to ids, creating the tags that don't exist yet. Names
+    seen before are answered from an in-process map; the rest are inserted
+    with one INSERT ... ON CONFLICT DO NOTHING per chunk and read back, so
+    concurrent writers end up with the same ids.
+
+    The map is dropped whenever the write generation moves (the API and
+    admin bump it on every write), and an engine's map whenever a
+    transaction that created tags rolls back, since that undid them.
+    """
+
+    def __init__(self):
+        # name -> id, per engine
+        self._ids = weakref.WeakKeyDictionary()
+        self._generation = write_generation.value
+        self._lock = threading.Lock()
+
+    def resolve(
+        self, connection, tags: Mapping[str, Optional[str]]
+    ) -> Dict[str, int]:
+        """
+        Return a name -> id map for `tags`, a name -> description map whose
+        descriptions are only used for tags that get created
+        """
+        with self._lock:
+            if self._generation != write_generation.value:
+                self._ids.clear()
+                self._generation = write_generation.value
+            ids = self._ids.setdefault(connection.engine, {})
+            missing = [name for name in tags if name not in ids]
+            for start in range(0, len(missing), CHUNK_SIZE):
+                chunk = missing[start : start + CHUNK_SIZE]
+                connection.execute(
+                    insert(Tag).on_conflict_do_nothing(index_elements=["name"]),
+                    [{"name": name, "description": tags[name]} for name in chunk],
+                )
+                connection.info[CREATED_TAGS] = True
+                ids.update(
+                    connection.execute(
+                        select(Tag.name, Tag.id).where(Tag.name.in_(chunk))
+                    ).all()
+                )
+            return {name: ids[name] for name in tags}
+
+    def forget(self, engine: Engine) -> None:
+        with self._lock:
+            self._ids.pop(engine, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids.clear()
+
+
+tag_resolver = TagResolver()
+
+
+@event.listens_for(Engine, "commit")
+def _keep_committed_tags(connection):
+    connection.info.pop(CREATED_TAGS, None)
+
+
+@event.listens_for(Engine, "rollback")
+def _forget_rolled_back_tags(connection):
+    if connection.info.pop(CREATED_TAGS, False):
+        tag_resolver.forget(connection.engine)
@@ -0,0 +1,397 @@
+import json
+import math
+import re
+import threading
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+from .models import Document
+
+# Only the start of very long documents is embedded
+MAX_EMBED_CHARS = 20000
+
+TOKEN_RE = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    """a an and are as at be but by for from has have i if in is it its of on
+    or so that the this to was we were what when which with you your""".split()
+)
+
+
+class Embedder:
+    """
+    Turns texts into L2-normalized float32 vectors, one row per text.
+    `name` identifies the vector space; vectors from different names are
+    never compared.
+    """
+
+    name: str
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic bag-of-words embedder using signed feature hashing and
+    sublinear term frequency. Needs no model or corpus statistics, so
+    documents can be embedded one at a time.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+        self._buckets = {}
+
+    def _bucket(self, token: str) -> tuple[int, float]:
+        bucket = self._buckets.get(token)
+        if bucket is None:
+            h = zlib.crc32(token.encode())
+            bucket = (h % self.dim, 1.0 if h & 0x80000000 else -1.0)
+            if len(self._buckets) < 1_000_000:
+                self._buckets[token] = bucket
+        return bucket
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text_ in enumerate(texts):
+            counts = Counter(TOKEN_RE.findall(text_.lower()))
+            vector = vectors[row]
+            for token, count in counts.items():
+                if token not in STOPWORDS:
+                    column, sign = self._bucket(token)
+                    vector[column] += sign * (1.0 + math.log(count))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class LLMEmbedder(Embedder):
+    """
+    Embedder backed by an `llm` embedding model plugin, e.g. a local
+    sentence-transformers model
+    """
+
+    def __init__(self, model_id: str):
+        import llm
+
+        self.model = llm.get_embedding_model(model_id)
+        self.name = f"llm-{model_id}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.array(list(self.model.embed_batch(texts)), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+_embedders = {}
+
+
+def get_embedder() -> Embedder:
+    """
+    Return the embedder named by `Settings.embedder`: `hashing`,
+    `hashing-<dim>` or `llm:<model id>`
+    """
+    spec = get_settings().embedder
+    if spec not in _embedders:
+        if spec.startswith("llm:"):
+            _embedders[spec] = LLMEmbedder(spec[len("llm:") :])
+        elif spec.startswith("hashing"):
+            _, _, dim = spec.partition("-")
+            _embedders[spec] = HashingEmbedder(int(dim) if dim else 512)
+        else:
+            raise ValueError(f"Unknown embedder {spec!r}")
+    return _embedders[spec]
+
+
+def document_text(title: str, description: Optional[str], content: str) -> str:
+    return "\n".join([title, description or "", content[:MAX_EMBED_CHARS]])
+
+
+def store_embeddings(connection, documents: Iterable[tuple]) -> None:
+    """
+    Embed (id, title, description, content) tuples and upsert them into
+    `documentembedding`. Each write takes the next number from
+    `embeddingversion` so the in-process index can pick up changes
+    incrementally.
+    """
+    documents = list(documents)
+    if not documents:
+        return
+    embedder = get_embedder()
+    vectors = embedder.embed([document_text(*doc[1:]) for doc in documents])
+    connection.execute(
+        text("UPDATE embeddingversion SET version = version + :count"),
+        {"count": len(documents)},
+    )
+    version = (
+        connection.execute(text("SELECT version FROM embeddingversion")).scalar()
+        - len(documents)
+    )
+    connection.execute(
+        text(
+            """
+            INSERT INTO documentembedding (document_id, embedder, vector, version)
+            VALUES (:document_id, :embedder, :vector, :version)
+            ON CONFLICT (document_id) DO UPDATE SET
+                embedder = excluded.embedder,
+                vector = excluded.vector,
+                version = excluded.version
+            """
+        ),
+        [
+            {
+                "document_id": doc[0],
+                "embedder": embedder.name,
+                "vector": vector.tobytes(),
+                "version": version + i + 1,
+            }
+            for i, (doc, vector) in enumerate(zip(documents, vectors))
+        ],
+    )
+
+
+def backfill_embeddings(connection, batch_size: int = 500) -> int:
+    """
+    Embed every document that has no vector from the current embedder, e.g.
+    after a bulk load that bypassed the ORM or after switching embedders.
+    """
+    name = get_embedder().name
+    done = 0
+    while True:
+        rows = connection.execute(
+            text(
+                """
+                SELECT d.id, d.title, d.description, d.content
+                FROM document d
+                LEFT JOIN documentembedding e ON e.document_id = d.id
+                WHERE e.document_id IS NULL OR e.embedder != :name
+                LIMIT :limit
+                """
+            ),
+            {"name": name, "limit": batch_size},
+        ).all()
+        if not rows:
+            return done
+        store_embeddings(connection, rows)
+        done += len(rows)
+
+
+@event.listens_for(Session, "after_flush")
+def _embed_flushed_documents(session, flush_context):
+    """
+    Keep embeddings current for documents written through the ORM (API,
+    admin, importers), in the same transaction as the write
+    """
+    if not get_settings().vector_search_enabled:
+        return
+    changed = [obj for obj in session.new if isinstance(obj, Document)]
+    for obj in session.dirty:
+        if isinstance(obj, Document):
+            state = inspect(obj)
+            if any(
+                state.attrs[name].history.has_changes()
+                for name in ("title", "description", "content")
+            ):
+                changed.append(obj)
+    store_embeddings(
+        session.connection(),
+        ((doc.id, doc.title, doc.description, doc.content) for doc in changed),
+    )
+
+
+class VectorIndex:
+    """
+    Brute-force cosine index over `documentembedding`, held in a NumPy
+    matrix. With a directory, the matrix and its id map are memory-mapped
+    .npy files that survive restarts; otherwise they live in memory.
+
+    `sync` only reads rows whose version is newer than the last one seen,
+    updating vectors in place for edited documents, appending new ones and
+    dropping those logged in `documentembeddingdeleted`.
+    """
+
+    def __init__(self, directory: Optional[Path] = None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.embedder_name = None
+        self.version = 0
+        self.count = 0
+        self.matrix = None
+        self.ids = np.zeros(0, dtype=np.int64)
+        self._slots = {}
+        if self.directory and (self.directory / "meta.json").exists():
+            self._load()
+
+    def _load(self) -> None:
+        meta = json.loads((self.directory / "meta.json").read_text())
+        self.embedder_name = meta["embedder"]
+        self.version = meta["version"]
+        self.count = meta["count"]
+        self.matrix = np.load(self.directory / "matrix.npy", mmap_mode="r+")
+        self.ids = np.load(self.directory / "ids.npy", mmap_mode="r+")
+        self._slots = {int(id_): slot for slot, id_ in enumerate(self.ids[: self.count])}
+
+    def _save(self) -> None:
+        if not self.directory:
+            return
+        self.matrix.flush()
+        self.ids.flush()
+        meta = {
+            "embedder": self.embedder_name,
+            "version": self.version,
+            "count": self.count,
+        }
+        (self.directory / "meta.json").write_text(json.dumps(meta))
+
+    def _allocate(self, capacity: int, dim: int) -> None:
+        """Grow the matrix and id map to hold `capacity` rows"""
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            matrix = np.lib.format.open_memmap(
+                self.directory / "matrix.tmp.npy",
+                mode="w+",
+                dtype=np.float32,
+                shape=(capacity, dim),
+            )
+            ids = np.lib.format.open_memmap(
+                self.directory / "ids.tmp.npy",
+                mode="w+",
+                dtype=np.int64,
+                shape=(capacity,),
+            )
+        else:
+            matrix = np.zeros((capacity, dim), dtype=np.float32)
+            ids = np.zeros(capacity, dtype=np.int64)
+        if self.matrix is not None:
+            matrix[: self.count] = self.matrix[: self.count]
+            ids[: self.count] = self.ids[: self.count]
+        if self.directory:
+            matrix.flush()
+            ids.flush()
+            (self.directory / "matrix.tmp.npy").replace(self.directory / "matrix.npy")
+            (self.directory / "ids.tmp.npy").replace(self.directory / "ids.npy")
+        self.matrix, self.ids = matrix, ids
+
+    def sync(self, connection) -> None:
+        name = get_embedder().name
+        with self._lock:
+            latest = connection.execute(
+                text("SELECT version FROM embeddingversion")
+            ).scalar()
+            if latest < self.version or name != self.embedder_name:
+                # The database was replaced or the vector space changed
+                if self.directory:
+                    (self.directory / "meta.json").unlink(missing_ok=True)
+                self.reset()
+                self.embedder_name = name
+            result = connection.execute(
+                text(
+                    """
+                    SELECT document_id, vector, version FROM documentembedding
+                    WHERE version > :version AND embedder = :name
+                    UNION ALL
+                    SELECT document_id, NULL, version FROM documentembeddingdeleted
+                    WHERE version > :version
+                    ORDER BY version
+                    """
+                ),
+                {"version": self.version, "name": name},
+            )
+            changed = False
+            for document_id, blob, version in result:
+                self.version = version
+                changed = True
+                if blob is None:
+                    self._remove(document_id)
+                    continue
+                vector = np.frombuffer(blob, dtype=np.float32)
+                if self.matrix is None or self.matrix.shape[1] != len(vector):
+                    self.count = 0
+                    self._slots = {}
+                    self.matrix = None
+                    self._allocate(1024, len(vector))
+                slot = self._slots.get(document_id)
+                if slot is None:
+                    if self.count == len(self.ids):
+                        self._allocate(2 * len(self.ids), self.matrix.shape[1])
+                    slot = self.count
+                    self.count += 1
+                    self._slots[document_id] = slot
+                    self.ids[slot] = document_id
+                self.matrix[slot] = vector
+            if changed:
+                self._save()
+
+    def _remove(self, document_id: int) -> None:
+        """Drop a document's vector, moving the last row into its slot"""
+        slot = self._slots.pop(document_id, None)
+        if slot is None:
+            return
+        self.count -= 1
+        if slot != self.count:
+            moved = int(self.ids[self.count])
+            self.matrix[slot] = self.matrix[self.count]
+            self.ids[slot] = moved
+            self._slots[moved] = slot
+
+    def search(self, vector: np.ndarray, k: int) -> List[tuple[int, float]]:
+        """Return up to `k` (document id, cosine similarity), best first"""
+        with self._lock:
+            if not self.count:
+                return []
+            scores = self.matrix[: self.count] @ vector
+            k = min(k, self.count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            return [(int(self.ids[i]), float(scores[i])) for i in top]
+
+
+def _index_directory(connection) -> Optional[Path]:
+    """
+    Keep the index next to a file-backed database; in-memory databases get
+    an in-memory index
+    """
+    settings = get_settings()
+    if settings.vector_index_path:
+        return Path(settings.vector_index_path)
+    database = connection.engine.url.database
+    if not database or database == ":memory:":
+        return None
+    return Path(database).with_suffix(".vectors")
+
+
+# One index per database, keyed by index directory
+vector_indexes: dict[Optional[Path], VectorIndex] = {}
+
+
+def semantic_search(session, query: str, k: int) -> List[tuple[int, float]]:
+    """Return the `k` documents most similar to `query`, best first"""
+    connection = session.connection()
+    directory = _index_directory(connection)
+    if directory not in vector_indexes:
+        vector_indexes[directory] = VectorIndex(directory)
+    index = vector_indexes[directory]
+    index.sync(connection)
+    return index.search(get_embedder().embed([query])[0], k)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        from .main import engine, create_db_and_tables
+
+        create_db_and_tables()
+        with engine.begin() as connection:
+            print(f"Embedded {backfill_embeddings(connection)} documents")
@@ -0,0 +1,73 @@
+-- Filter interestingness on the document table instead of the FTS index
+CREATE INDEX IF NOT EXISTS ix_document_interestingness ON document (interestingness);
+
+-- Drop the triggers that write the old interestingness FTS column
+DROP TRIGGER IF EXISTS document_ai;
+DROP TRIGGER IF EXISTS document_au;
+
+-- Rebuild FTS table without interestingness, which only added "0"/"1"/"2" terms
+DROP TABLE IF EXISTS documentfts;
+CREATE VIRTUAL TABLE documentfts USING fts5(
+    title,
+    description,
+    content,
+    tag_data
+);
+
+-- Reindex existing documents
+INSERT INTO documentfts(rowid, title, description, content, tag_data)
+SELECT
+    d.id,
+    d.title,
+    COALESCE(d.description, ''),
+    d.content,
+    COALESCE(
+        (
+            SELECT GROUP_CONCAT(t.name || ' ' || COALESCE(t.description, ''), ' ')
+            FROM tag t
+            JOIN documenttag dt ON dt.tag_id = t.id
+            WHERE dt.document_id = d.id
+        ),
+        ''
+    )
+FROM document d;
+
+-- Recreate triggers to match create_db_and_tables
+CREATE TRIGGER document_ai AFTER INSERT ON document BEGIN
+    INSERT INTO documentfts(rowid, title, description, content, tag_data)
+    VALUES (
+        new.id,
+        new.title,
+        COALESCE(new.description, ''),
+        new.content,
+        COALESCE(
+            (
+                SELECT GROUP_CONCAT(t.name || ' ' || COALESCE(t.description, ''), ' ')
+                FROM tag t
+                JOIN documenttag dt ON dt.tag_id = t.id
+                WHERE dt.document_id = new.id
+            ),
+            ''
+        )
+    );
+END;
+
+CREATE TRIGGER document_au AFTER UPDATE ON document BEGIN
+    DELETE FROM documentfts WHERE rowid = old.id;
+    INSERT INTO documentfts(rowid, title, description, content, tag_data)
+    VALUES (
+        new.id,
+        new.title,
+        COALESCE(new.description, ''),
+        new.content,
+        COALESCE(
+            (
+                SELECT GROUP_CONCAT(t.name || ' ' || COALESCE(t.description, ''), ' ')
+                FROM tag t
+                JOIN documenttag dt ON dt.tag_id = t.id
+                WHERE dt.document_id = new.id
+            ),
+            ''
+        )
+    );
+END;
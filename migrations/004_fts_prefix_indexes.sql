@@ -0,0 +1,29 @@
+-- Rebuild FTS table with prefix indexes for trailing-wildcard queries.
+-- The prefix lengths are hard-coded to the default '2 3 4' and ignore the
+-- FTS_PREFIX_LENGTHS setting, which only applies to newly created tables.
+DROP TABLE IF EXISTS documentfts;
+CREATE VIRTUAL TABLE documentfts USING fts5(
+    title,
+    description,
+    content,
+    tag_data,
+    prefix='2 3 4'
+);
+
+-- Reindex existing documents
+INSERT INTO documentfts(rowid, title, description, content, tag_data)
+SELECT
+    d.id,
+    d.title,
+    COALESCE(d.description, ''),
+    d.content,
+    COALESCE(
+        (
+            SELECT GROUP_CONCAT(t.name || ' ' || COALESCE(t.description, ''), ' ')
+            FROM tag t
+            JOIN documenttag dt ON dt.tag_id = t.id
+            WHERE dt.document_id = d.id
+        ),
+        ''
+    )
+FROM document d;
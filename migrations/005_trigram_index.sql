@@ -0,0 +1,30 @@
+-- Secondary trigram index for substring searches, reading text from document
+CREATE VIRTUAL TABLE IF NOT EXISTS documentfts_trigram USING fts5(
+    title,
+    description,
+    content,
+    content='document',
+    content_rowid='id',
+    tokenize='trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS document_trigram_ai AFTER INSERT ON document BEGIN
+    INSERT INTO documentfts_trigram(rowid, title, description, content)
+    VALUES (new.id, new.title, new.description, new.content);
+END;
+
+CREATE TRIGGER IF NOT EXISTS document_trigram_ad AFTER DELETE ON document BEGIN
+    INSERT INTO documentfts_trigram(documentfts_trigram, rowid, title, description, content)
+    VALUES ('delete', old.id, old.title, old.description, old.content);
+END;
+
+CREATE TRIGGER IF NOT EXISTS document_trigram_au
+AFTER UPDATE OF title, description, content ON document BEGIN
+    INSERT INTO documentfts_trigram(documentfts_trigram, rowid, title, description, content)
+    VALUES ('delete', old.id, old.title, old.description, old.content);
+    INSERT INTO documentfts_trigram(rowid, title, description, content)
+    VALUES (new.id, new.title, new.description, new.content);
+END;
+
+-- Index existing documents
+INSERT INTO documentfts_trigram(documentfts_trigram) VALUES ('rebuild');
@@ -0,0 +1,2 @@
+-- Serve tag_ids/exclude_tag_ids search filters and tag facets by tag
+CREATE INDEX IF NOT EXISTS ix_documenttag_tag_id ON documenttag (tag_id, document_id);
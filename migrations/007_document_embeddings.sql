@@ -0,0 +1,12 @@
+-- Embeddings for hybrid search; fill with `python -m app.vectors backfill`
+CREATE TABLE IF NOT EXISTS documentembedding (
+    document_id INTEGER NOT NULL PRIMARY KEY REFERENCES document (id),
+    embedder VARCHAR NOT NULL,
+    vector BLOB NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_documentembedding_version ON documentembedding (version);
+
+CREATE TRIGGER IF NOT EXISTS document_embedding_ad AFTER DELETE ON document BEGIN
+    DELETE FROM documentembedding WHERE document_id = old.id;
+END;
@@ -0,0 +1,3 @@
+-- Serve created_after/created_before filters and sort=created_at
+CREATE INDEX IF NOT EXISTS ix_document_created_at ON document (created_at);
+CREATE INDEX IF NOT EXISTS ix_document_updated_at ON document (updated_at);
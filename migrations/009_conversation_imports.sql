@@ -0,0 +1,9 @@
+-- Import state for utils.load_data_from_chatgpt_history, one row per conversation
+CREATE TABLE IF NOT EXISTS conversationimport (
+    conversation_id VARCHAR NOT NULL PRIMARY KEY,
+    update_time FLOAT,
+    content_hash VARCHAR NOT NULL,
+    document_id INTEGER REFERENCES document (id),
+    imported_at DATETIME NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_conversationimport_document_id ON conversationimport (document_id);
@@ -0,0 +1,12 @@
+-- Tag names are unique. Merge duplicates into the oldest tag of each name,
+-- moving their documents over, before replacing the plain index.
+INSERT OR IGNORE INTO documenttag (document_id, tag_id)
+SELECT dt.document_id, (SELECT MIN(t2.id) FROM tag t2 WHERE t2.name = t.name)
+FROM documenttag dt
+JOIN tag t ON t.id = dt.tag_id;
+
+DELETE FROM documenttag WHERE tag_id NOT IN (SELECT MIN(id) FROM tag GROUP BY name);
+DELETE FROM tag WHERE id NOT IN (SELECT MIN(id) FROM tag GROUP BY name);
+
+DROP INDEX IF EXISTS ix_tag_name;
+CREATE UNIQUE INDEX ix_tag_name ON tag (name);
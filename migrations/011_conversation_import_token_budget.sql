@@ -0,0 +1,2 @@
+-- Token budget a conversation was abridged to before scoring, if any
+ALTER TABLE conversationimport ADD COLUMN token_budget INTEGER;
@@ -0,0 +1,67 @@
+-- Tag changes queue the affected documents instead of rewriting their FTS
+-- rows once per link; app.fts.flush_dirty_documents rebuilds each queued
+-- row once per transaction
+CREATE TABLE IF NOT EXISTS documentftsdirty (
+    document_id INTEGER NOT NULL PRIMARY KEY
+);
+
+DROP TRIGGER IF EXISTS documenttag_ai;
+CREATE TRIGGER documenttag_ai AFTER INSERT ON documenttag BEGIN
+    INSERT OR IGNORE INTO documentftsdirty (document_id) VALUES (new.document_id);
+END;
+
+DROP TRIGGER IF EXISTS documenttag_ad;
+CREATE TRIGGER documenttag_ad AFTER DELETE ON documenttag BEGIN
+    INSERT OR IGNORE INTO documentftsdirty (document_id) VALUES (old.document_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS tag_au AFTER UPDATE OF name, description ON tag BEGIN
+    INSERT OR IGNORE INTO documentftsdirty (document_id)
+    SELECT document_id FROM documenttag WHERE tag_id = new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS tag_ad AFTER DELETE ON tag BEGIN
+    INSERT OR IGNORE INTO documentftsdirty (document_id)
+    SELECT document_id FROM documenttag WHERE tag_id = old.id;
+END;
+
+-- Only text changes need the document's row rewritten
+DROP TRIGGER IF EXISTS document_au;
+CREATE TRIGGER document_au AFTER UPDATE OF title, description, content ON document BEGIN
+    DELETE FROM documentfts WHERE rowid = old.id;
+    INSERT INTO documentfts(rowid, title, description, content, tag_data)
+    VALUES (
+        new.id,
+        new.title,
+        COALESCE(new.description, ''),
+        new.content,
+        COALESCE(
+            (
+                SELECT GROUP_CONCAT(t.name || ' ' || COALESCE(t.description, ''), ' ')
+                FROM tag t
+                JOIN documenttag dt ON dt.tag_id = t.id
+                WHERE dt.document_id = new.id
+            ),
+            ''
+        )
+    );
+END;
+
+-- Tag descriptions edited before this migration were never indexed
+DELETE FROM documentfts;
+INSERT INTO documentfts(rowid, title, description, content, tag_data)
+SELECT
+    d.id,
+    d.title,
+    COALESCE(d.description, ''),
+    d.content,
+    COALESCE(
+        (
+            SELECT GROUP_CONCAT(t.name || ' ' || COALESCE(t.description, ''), ' ')
+            FROM tag t
+            JOIN documenttag dt ON dt.tag_id = t.id
+            WHERE dt.document_id = d.id
+        ),
+        ''
+    )
+FROM document d;
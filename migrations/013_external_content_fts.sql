@@ -0,0 +1,87 @@
+-- Make documentfts an external-content table, so title, description and
+-- content are no longer stored a second time in its shadow tables. The text
+-- is read from `document` through the documentftscontent view; tag_data has
+-- no column there and is kept in documentftstags. Run VACUUM afterwards to
+-- hand the freed pages back to the filesystem. The prefix lengths are
+-- hard-coded to the default '2 3 4' and ignore the FTS_PREFIX_LENGTHS
+-- setting, which only applies to newly created tables.
+CREATE TABLE IF NOT EXISTS documentftstags (
+    document_id INTEGER NOT NULL PRIMARY KEY,
+    tag_data TEXT NOT NULL
+);
+
+INSERT OR REPLACE INTO documentftstags (document_id, tag_data)
+SELECT
+    d.id,
+    COALESCE(
+        (
+            SELECT GROUP_CONCAT(t.name || ' ' || COALESCE(t.description, ''), ' ')
+            FROM tag t
+            JOIN documenttag dt ON dt.tag_id = t.id
+            WHERE dt.document_id = d.id
+        ),
+        ''
+    )
+FROM document d;
+
+CREATE VIEW IF NOT EXISTS documentftscontent AS
+SELECT
+    d.id AS id,
+    d.title AS title,
+    COALESCE(d.description, '') AS description,
+    d.content AS content,
+    COALESCE(t.tag_data, '') AS tag_data
+FROM document d
+LEFT JOIN documentftstags t ON t.document_id = d.id;
+
+DROP TABLE IF EXISTS documentfts;
+CREATE VIRTUAL TABLE documentfts USING fts5(
+    title,
+    description,
+    content,
+    tag_data,
+    content='documentftscontent',
+    content_rowid='id',
+    prefix='2 3 4'
+);
+INSERT INTO documentfts(documentfts) VALUES ('rebuild');
+DELETE FROM documentftsdirty;
+
+DROP TRIGGER IF EXISTS document_ai;
+CREATE TRIGGER document_ai AFTER INSERT ON document BEGIN
+    INSERT INTO documentfts(rowid, title, description, content, tag_data)
+    SELECT id, title, description, content, tag_data
+    FROM documentftscontent
+    WHERE id = new.id;
+END;
+
+DROP TRIGGER IF EXISTS document_ad;
+CREATE TRIGGER document_ad AFTER DELETE ON document BEGIN
+    INSERT INTO documentfts(documentfts, rowid, title, description, content, tag_data)
+    VALUES (
+        'delete',
+        old.id,
+        old.title,
+        COALESCE(old.description, ''),
+        old.content,
+        COALESCE((SELECT tag_data FROM documentftstags WHERE document_id = old.id), '')
+    );
+    DELETE FROM documentftstags WHERE document_id = old.id;
+END;
+
+DROP TRIGGER IF EXISTS document_au;
+CREATE TRIGGER document_au AFTER UPDATE OF title, description, content ON document BEGIN
+    INSERT INTO documentfts(documentfts, rowid, title, description, content, tag_data)
+    VALUES (
+        'delete',
+        old.id,
+        old.title,
+        COALESCE(old.description, ''),
+        old.content,
+        COALESCE((SELECT tag_data FROM documentftstags WHERE document_id = old.id), '')
+    );
+    INSERT INTO documentfts(rowid, title, description, content, tag_data)
+    SELECT id, title, description, content, tag_data
+    FROM documentftscontent
+    WHERE id = new.id;
+END;
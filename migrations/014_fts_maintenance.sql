@@ -0,0 +1,6 @@
+-- When documentfts was last merged and last left as a single segment, as
+-- reported by GET /fts/stats. automerge/crisismerge are applied at startup.
+CREATE TABLE IF NOT EXISTS documentftsmaintenance (
+    operation TEXT NOT NULL PRIMARY KEY,
+    ran_at TEXT NOT NULL
+);
@@ -0,0 +1,56 @@
+-- Every change to searchable data bumps searchdataversion, so API processes
+-- notice writes made by imports and embedding backfills running elsewhere
+-- and drop their cached search results (app.cache.sync_search_caches)
+CREATE TABLE IF NOT EXISTS searchdataversion (
+    id INTEGER NOT NULL PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO searchdataversion (id, version) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS document_version_ai AFTER INSERT ON document BEGIN
+    UPDATE searchdataversion SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS document_version_au AFTER UPDATE ON document BEGIN
+    UPDATE searchdataversion SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS document_version_ad AFTER DELETE ON document BEGIN
+    UPDATE searchdataversion SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS tag_version_ai AFTER INSERT ON tag BEGIN
+    UPDATE searchdataversion SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS tag_version_au AFTER UPDATE ON tag BEGIN
+    UPDATE searchdataversion SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS tag_version_ad AFTER DELETE ON tag BEGIN
+    UPDATE searchdataversion SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS documenttag_version_ai AFTER INSERT ON documenttag BEGIN
+    UPDATE searchdataversion SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS documenttag_version_au AFTER UPDATE ON documenttag BEGIN
+    UPDATE searchdataversion SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS documenttag_version_ad AFTER DELETE ON documenttag BEGIN
+    UPDATE searchdataversion SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS documentembedding_version_ai AFTER INSERT ON documentembedding BEGIN
+    UPDATE searchdataversion SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS documentembedding_version_au AFTER UPDATE ON documentembedding BEGIN
+    UPDATE searchdataversion SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS documentembedding_version_ad AFTER DELETE ON documentembedding BEGIN
+    UPDATE searchdataversion SET version = version + 1;
+END;
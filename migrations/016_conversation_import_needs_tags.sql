@@ -0,0 +1,2 @@
+-- Interesting conversations are tagged after the scoring pass; set until then
+ALTER TABLE conversationimport ADD COLUMN needs_tags BOOLEAN NOT NULL DEFAULT 0;
@@ -0,0 +1,47 @@
+-- New documents are only queued by document_ai and indexed, tag_data
+-- included, by app.fts.flush_dirty_documents, instead of being indexed
+-- once without tags and then again by the flush. A documentftstags row now
+-- marks a document as indexed; documents the old document_ai indexed on its
+-- own were indexed with empty tag_data and get that row here.
+INSERT OR IGNORE INTO documentftstags (document_id, tag_data)
+SELECT id, '' FROM document;
+
+DROP TRIGGER IF EXISTS document_ai;
+CREATE TRIGGER document_ai AFTER INSERT ON document BEGIN
+    INSERT OR IGNORE INTO documentftsdirty (document_id) VALUES (new.id);
+END;
+
+DROP TRIGGER IF EXISTS document_ad;
+CREATE TRIGGER document_ad AFTER DELETE ON document
+WHEN EXISTS (SELECT 1 FROM documentftstags WHERE document_id = old.id)
+BEGIN
+    INSERT INTO documentfts(documentfts, rowid, title, description, content, tag_data)
+    VALUES (
+        'delete',
+        old.id,
+        old.title,
+        COALESCE(old.description, ''),
+        old.content,
+        COALESCE((SELECT tag_data FROM documentftstags WHERE document_id = old.id), '')
+    );
+    DELETE FROM documentftstags WHERE document_id = old.id;
+END;
+
+DROP TRIGGER IF EXISTS document_au;
+CREATE TRIGGER document_au AFTER UPDATE OF title, description, content ON document
+WHEN EXISTS (SELECT 1 FROM documentftstags WHERE document_id = old.id)
+BEGIN
+    INSERT INTO documentfts(documentfts, rowid, title, description, content, tag_data)
+    VALUES (
+        'delete',
+        old.id,
+        old.title,
+        COALESCE(old.description, ''),
+        old.content,
+        COALESCE((SELECT tag_data FROM documentftstags WHERE document_id = old.id), '')
+    );
+    INSERT INTO documentfts(rowid, title, description, content, tag_data)
+    SELECT id, title, description, content, tag_data
+    FROM documentftscontent
+    WHERE id = new.id;
+END;
@@ -0,0 +1,10 @@
+-- Only re-tokenize the trigram row when indexed text changes, not on
+-- interestingness or date edits (databases that already applied 005)
+DROP TRIGGER IF EXISTS document_trigram_au;
+CREATE TRIGGER document_trigram_au
+AFTER UPDATE OF title, description, content ON document BEGIN
+    INSERT INTO documentfts_trigram(documentfts_trigram, rowid, title, description, content)
+    VALUES ('delete', old.id, old.title, old.description, old.content);
+    INSERT INTO documentfts_trigram(rowid, title, description, content)
+    VALUES (new.id, new.title, new.description, new.content);
+END;
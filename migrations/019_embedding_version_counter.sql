@@ -0,0 +1,22 @@
+-- Embedding versions came from MAX(version) + 1, so deleting the newest
+-- embedding let its version be handed out again and VectorIndex.sync
+-- skipped the new row. They now come from a counter that only grows, and
+-- deleted embeddings are logged under a version of their own so sync can
+-- drop them from the index.
+CREATE TABLE IF NOT EXISTS embeddingversion (
+    id INTEGER NOT NULL PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO embeddingversion (id, version)
+SELECT 1, COALESCE(MAX(version), 0) FROM documentembedding;
+
+CREATE TABLE IF NOT EXISTS documentembeddingdeleted (
+    version INTEGER NOT NULL PRIMARY KEY,
+    document_id INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS documentembedding_ad AFTER DELETE ON documentembedding BEGIN
+    UPDATE embeddingversion SET version = version + 1;
+    INSERT INTO documentembeddingdeleted (version, document_id)
+    SELECT version, old.document_id FROM embeddingversion;
+END;
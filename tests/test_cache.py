@@ -0,0 +1,28 @@
+from app.cache import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats() == {"entries": 2, "bytes": 0, "hits": 3, "misses": 1}
+
+
+def test_lru_cache_bounded_by_bytes():
+    cache = LRUCache(max_entries=10, max_bytes=10, sizeof=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "xxxx")
+    cache.set("c", "xxxx")
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 8
+
+    # Values larger than the whole budget are never stored
+    cache.set("d", "x" * 11)
+    assert cache.get("d") is None
+    assert cache.get("c") == "xxxx"
@@ -0,0 +1,363 @@
+import functools
+import json
+import threading
+import zipfile
+
+from sqlmodel import Session, create_engine, select
+from sqlmodel.pool import StaticPool
+import pytest
+
+from app.main import create_db_and_tables
+from app.models import ConversationImport, Document, Tag
+from utils import load_data_from_chatgpt_history as importer
+from utils.llm_pipeline import (
+    ReliableModel,
+    Reply,
+    ResponseCache,
+    TokenBucket,
+    TokenBudget,
+    estimate_tokens,
+)
+
+
+class StubModel:
+    """Scores conversations mentioning 'philosophy' as 2, tags them 'thinking'"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def prompt(self, prompt):
+        with self.lock:
+            self.prompts.append(prompt)
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("rate limited")
+        if prompt.startswith("Score"):
+            text = "2" if "philosophy" in prompt else "0"
+        else:
+            text = json.dumps([{"name": "thinking", "description": "Deep thoughts"}])
+        return Reply(text)
+
+
+def conversation(title, text, create_time=1700000000, update_time=None):
+    return {
+        "id": title.lower().replace(" ", "-"),
+        "title": title,
+        "update_time": update_time or create_time,
+        "create_time": create_time,
+        "current_node": "b",
+        "mapping": {
+            "a": {
+                "message": {
+                    "author": {"role": "user"},
+                    "content": {"content_type": "text", "parts": [text]},
+                },
+                "parent": None,
+            },
+            "b": {
+                "message": {
+                    "author": {"role": "assistant"},
+                    "content": {"content_type": "text", "parts": ["Indeed."]},
+                },
+                "parent": "a",
+            },
+        },
+    }
+
+
+def memory_engine():
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    create_db_and_tables(engine)
+    return engine
+
+
+@pytest.fixture(name="engine")
+def engine_fixture(monkeypatch):
+    engine = memory_engine()
+    monkeypatch.setattr(importer, "engine", engine)
+    return engine
+
+
+def write_export(path, conversations):
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("conversations.json", json.dumps(conversations))
+    return path
+
+
+def export_conversations():
+    return [
+        conversation(f"Chat {i}", "philosophy of mind" if i % 2 else "fix my regex")
+        for i in range(10)
+    ]
+
+
+@pytest.fixture(name="zip_path")
+def zip_path_fixture(tmp_path):
+    return write_export(tmp_path / "export.zip", export_conversations())
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(
+        importer, "ReliableModel", functools.partial(ReliableModel, base_delay=0)
+    )
+
+
+def run_import(zip_path, model, **kwargs):
+    importer.extract_conversations(
+        zip_path, requests_per_minute=60000, model=model, **{"workers": 4, **kwargs}
+    )
+
+
+def test_extract_conversations_with_stub_model(engine, zip_path):
+    model = StubModel(failures=2)
+    importer.extract_conversations(
+        zip_path,
+        workers=4,
+        requests_per_minute=60000,
+        batch_size=3,
+        sample_size=5,
+        model=model,
+    )
+
+    with Session(engine) as session:
+        documents = session.exec(select(Document).order_by(Document.id)).all()
+        assert [doc.title for doc in documents] == [f"Chat {i}" for i in range(10)]
+        assert documents[0].content == "user: fix my regex\n\nChatGPT: Indeed."
+        assert [doc.interestingness for doc in documents[:2]] == [0, 2]
+        assert [tag.name for tag in documents[1].tags] == ["thinking"]
+        assert documents[0].tags == []
+        # Invented tags are created once and reused
+        assert len(session.exec(select(Tag)).all()) == 1
+    # One pass: 10 scores, 5 tags, 1 tag discovery and 2 retried failures
+    assert len(model.prompts) == 18
+    discovery = [p for p in model.prompts if "could categorise" in p]
+    assert len(discovery) == 1 and discovery[0].count("# Snippet") == 5
+    # Tagging comes after discovery and is offered its vocabulary
+    tagging = [i for i, p in enumerate(model.prompts) if "that categories" in p]
+    assert min(tagging) > model.prompts.index(discovery[0])
+    assert all("Deep thoughts" in model.prompts[i] for i in tagging)
+
+
+def test_token_bucket_limits_rate():
+    now = [0.0]
+
+    def sleep(delay):
+        now[0] += delay
+
+    bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0], sleep=sleep)
+    for _ in range(6):
+        bucket.acquire()
+    # The first two are the burst, the remaining four come at 2 per second
+    assert now[0] == pytest.approx(2.0)
+
+
+def test_reimport_skips_unchanged_and_updates_changed(engine, tmp_path, zip_path):
+    run_import(zip_path, StubModel(), sample_size=0)
+
+    model = StubModel()
+    run_import(zip_path, model, sample_size=0)
+    assert model.prompts == []
+
+    conversations = export_conversations()
+    conversations[0] = conversation(
+        "Chat 0", "the philosophy of regex", update_time=1800000000
+    )
+    # Touched but unchanged content is not re-scored either
+    conversations[2]["update_time"] = 1800000000
+    conversations.append(conversation("Chat 10", "fix my css"))
+    write_export(tmp_path / "newer.zip", conversations)
+    model = StubModel()
+    run_import(tmp_path / "newer.zip", model, sample_size=0)
+    # Score and tag the changed conversation, score the new one
+    assert len(model.prompts) == 3
+
+    with Session(engine) as session:
+        documents = session.exec(select(Document).order_by(Document.id)).all()
+        assert len(documents) == 11
+        assert documents[0].title == "Chat 0"
+        assert "philosophy of regex" in documents[0].content
+        assert documents[0].interestingness == 2
+        assert [tag.name for tag in documents[0].tags] == ["thinking"]
+        state = session.get(ConversationImport, "chat-2")
+        assert state.update_time == 1800000000
+        assert state.document_id == documents[2].id
+
+
+def test_reimport_updates_changed_content_with_same_update_time(engine, tmp_path):
+    unnamed = conversation("Untitled", "fix my regex")
+    del unnamed["id"]
+    write_export(tmp_path / "old.zip", [conversation("Chat", "fix my regex"), unnamed])
+    run_import(tmp_path / "old.zip", StubModel(), sample_size=0)
+
+    # Same update_time, different text: the content hash decides
+    changed = conversation("Chat", "the philosophy of regex")
+    unnamed_changed = conversation("Untitled", "fix my css")
+    del unnamed_changed["id"]
+    write_export(tmp_path / "new.zip", [changed, unnamed_changed])
+    model = StubModel()
+    run_import(tmp_path / "new.zip", model, sample_size=0)
+
+    with Session(engine) as session:
+        documents = session.exec(select(Document).order_by(Document.id)).all()
+        # Updated in place, the id-less conversation included
+        assert len(documents) == 2
+        assert "philosophy of regex" in documents[0].content
+        assert "fix my css" in documents[1].content
+
+
+def test_interrupted_import_resumes(engine, zip_path):
+    class InterruptingModel(StubModel):
+        def prompt(self, prompt):
+            if len(self.prompts) == 6:
+                raise KeyboardInterrupt
+            return super().prompt(prompt)
+
+    with pytest.raises(KeyboardInterrupt):
+        run_import(zip_path, InterruptingModel(), workers=1, batch_size=100)
+    with Session(engine) as session:
+        done = len(session.exec(select(Document)).all())
+    assert 0 < done < 10
+
+    model = StubModel()
+    run_import(zip_path, model, batch_size=100, sample_size=0)
+    with Session(engine) as session:
+        titles = [doc.title for doc in session.exec(select(Document))]
+    assert sorted(titles) == sorted(f"Chat {i}" for i in range(10))
+    scored = [p for p in model.prompts if p.startswith("Score")]
+    assert len(scored) == 10 - done
+
+
+def test_interrupted_tagging_resumes(engine, zip_path):
+    class InterruptingModel(StubModel):
+        def prompt(self, prompt):
+            if "that categories" in prompt:
+                raise KeyboardInterrupt
+            return super().prompt(prompt)
+
+    with pytest.raises(KeyboardInterrupt):
+        run_import(zip_path, InterruptingModel(), workers=1, sample_size=0)
+    with Session(engine) as session:
+        assert all(doc.tags == [] for doc in session.exec(select(Document)))
+
+    model = StubModel()
+    run_import(zip_path, model, sample_size=0)
+    # Nothing is scored again; the five interesting documents are tagged
+    assert len(model.prompts) == 5
+    assert not any(p.startswith("Score") for p in model.prompts)
+    with Session(engine) as session:
+        tagged = [doc for doc in session.exec(select(Document)) if doc.tags]
+        assert len(tagged) == 5
+        assert not session.exec(
+            select(ConversationImport).where(ConversationImport.needs_tags)
+        ).all()
+
+
+def test_response_cache_reuses_replies_across_databases(
+    engine, zip_path, tmp_path, monkeypatch
+):
+    cache = ResponseCache(tmp_path / "cache.db")
+    run_import(zip_path, StubModel(), sample_size=0, cache=cache, workers=1)
+    # Two distinct texts to score, one interesting one to tag
+    assert cache.stats() == "12 hits, 3 misses"
+
+    # A fresh database pays nothing for text the cache has seen
+    monkeypatch.setattr(importer, "engine", memory_engine())
+    model = StubModel()
+    cache = ResponseCache(tmp_path / "cache.db")
+    run_import(zip_path, model, sample_size=0, cache=cache)
+    assert model.prompts == []
+    assert cache.stats() == "15 hits, 0 misses"
+
+    # A new prompt version misses
+    monkeypatch.setattr(importer, "SCORE_PROMPT", "score-v2")
+    monkeypatch.setattr(importer, "engine", memory_engine())
+    model = StubModel()
+    run_import(zip_path, model, sample_size=0, cache=cache, workers=1)
+    assert len(model.prompts) == 2
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.db", max_bytes=35)
+    for i in range(3):
+        cache.set("model", "score-v1", f"text {i}", "x" * 10)
+    # Using "text 0" makes "text 1" the least recently used
+    assert cache.get("model", "score-v1", "text 0") == "x" * 10
+    cache.set("model", "score-v1", "text 3", "x" * 10)
+    assert cache.get("model", "score-v1", "text 1") is None
+    assert cache.get("model", "score-v1", "text 0") == "x" * 10
+    assert cache.get("model", "score-v1", "text 3") == "x" * 10
+
+
+def test_token_budget_keeps_edges_and_sampled_middle():
+    budget = TokenBudget(total=100, edge=20, window=10)
+    short = ["user: hi", "ChatGPT: hello"]
+    assert budget.fit(short) == (short, False)
+
+    text = "".join(f"{i:05d}" for i in range(2000))
+    (abridged,), cut = budget.fit([text])
+    assert cut
+    assert abridged.startswith(text[:80]) and abridged.endswith(text[-80:])
+    excerpts = abridged.split("\n[...]\n")
+    # Head, tail and evenly spaced excerpts from across the middle
+    assert len(excerpts) == 6
+    assert all(excerpt in text for excerpt in excerpts)
+    assert estimate_tokens(abridged) <= 100
+
+
+def test_token_budget_without_edges():
+    (abridged,), cut = TokenBudget(total=8000, edge=0).fit(["x" * 100000])
+    assert cut
+    assert estimate_tokens(abridged) <= 8000
+    # With no edges the budget goes to excerpts from the middle
+    text = "".join(f"{i:04d}" for i in range(1000))
+    (abridged,), cut = TokenBudget(total=100, edge=0, window=10).fit([text])
+    excerpts = abridged.split("\n[...]\n")
+    assert cut and len(excerpts) > 2
+    assert all(excerpt in text for excerpt in excerpts)
+    assert sum(map(len, excerpts)) >= 200
+    (abridged,), cut = TokenBudget(total=2).fit(["x" * 100])
+    assert cut and estimate_tokens(abridged) <= 2
+    with pytest.raises(ValueError):
+        TokenBudget(total=1).fit(["x" * 100])
+
+
+def test_long_conversations_are_abridged_and_recorded(engine, tmp_path):
+    long_text = "philosophy " * 10000
+    write_export(
+        tmp_path / "long.zip",
+        [conversation("Long", long_text), conversation("Short", "philosophy")],
+    )
+    model = StubModel()
+    run_import(
+        tmp_path / "long.zip",
+        model,
+        sample_size=0,
+        budget=TokenBudget(total=500, edge=100),
+    )
+    assert max(len(prompt) for prompt in model.prompts) < 4000
+    with Session(engine) as session:
+        assert session.get(ConversationImport, "long").token_budget == 500
+        assert session.get(ConversationImport, "short").token_budget is None
+        # The stored document keeps the full text
+        document = session.exec(select(Document).where(Document.title == "Long")).one()
+        assert long_text.strip() in document.content
+
+
+def test_reservoir_keeps_a_bounded_uniform_sample():
+    counts = [0] * 10
+    for _ in range(2000):
+        sample = importer.Reservoir(3)
+        for i in range(10):
+            sample.add(i)
+        assert len(sample.items) == 3
+        for i in sample.items:
+            counts[i] += 1
+    # Each item is kept with probability 3/10
+    assert all(450 < count < 750 for count in counts)
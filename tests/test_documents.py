@@ -1,11 +1,16 @@
+import json
 import tempfile
 import os
 from fastapi.testclient import TestClient
 from sqlmodel import Session, SQLModel, create_engine, select
 from sqlmodel.pool import StaticPool
+from sqlalchemy import event, text
 import pytest
 from unittest import mock
+from datetime import datetime
 from app.main import app, get_session, create_db_and_tables
+from app.cache import invalidate_search_caches
+from app.vectors import vector_indexes
 from app.models import Document, Tag
 from app.config import Settings
 
@@ -37,6 +42,10 @@ def client_fixture(engine: Session, session: Session, settings: Settings):
     def get_session_override():
         return session
 
+    # Each test gets a fresh database, so nothing cached may carry over
+    invalidate_search_caches()
+    vector_indexes.clear()
+
     with (
         mock.patch("app.main.get_settings", return_value=settings),
         mock.patch("app.main.engine", engine),
@@ -82,6 +91,39 @@ def test_create_document(client: TestClient, session: Session):
     assert created_doc["updated_at"] == document_data["updated_at"]
 
 
+def test_create_document_with_tag_names(client: TestClient, session: Session):
+    python = Tag(name="python", description="Python programming")
+    session.add(python)
+    session.commit()
+    session.refresh(python)
+
+    headers = {"X-API-Key": "dev_api_key"}
+    response = client.post(
+        "/documents/",
+        headers=headers,
+        json={
+            "title": "Tagged by name",
+            "content": "Content",
+            "tag_ids": [python.id],
+            "tag_names": ["python", "new-tag"],
+        },
+    )
+    assert response.status_code == 201
+    tags = {tag["name"]: tag for tag in response.json()["tags"]}
+    assert set(tags) == {"python", "new-tag"}
+    assert tags["python"]["id"] == python.id
+
+    response = client.post(
+        "/documents/bulk",
+        headers=headers,
+        json=[{"title": "Bulk", "content": "Content", "tag_names": ["new-tag"]}],
+    )
+    document_id = response.json()["results"][0]["id"]
+    response = client.get(f"/documents/{document_id}", headers=headers)
+    assert [tag["id"] for tag in response.json()["tags"]] == [tags["new-tag"]["id"]]
+    assert len(client.get("/tags/", headers=headers).json()) == 2
+
+
 def test_get_document(client: TestClient, session: Session):
     # Create test tags
     tag1 = Tag(name="python", description="Python programming")
@@ -277,3 +319,609 @@ def test_settings_mock(client: TestClient):
     """Test that settings have been mocked correctly"""
     response = client.get("/documents/999", headers={"X-API-Key": "dev_api_key"})
     assert response.status_code == 404  # Verifies API key was accepted
+
+
+def test_tag_changes_reindex_documents(client: TestClient, session: Session):
+    headers = {"X-API-Key": "dev_api_key"}
+    tags = [Tag(name=f"tag{i}", description=f"Label {i}") for i in range(3)]
+    session.add_all(tags)
+    session.commit()
+    document = Document(title="Plain", content="Nothing to see")
+    other = Document(title="Other", content="Nothing either", tags=[tags[0]])
+    session.add_all([document, other])
+    session.commit()
+
+    response = client.post(
+        f"/documents/{document.id}/tags",
+        headers=headers,
+        json={"tag_ids": [tag.id for tag in tags]},
+    )
+    assert response.status_code == 200
+    assert session.exec(text("SELECT COUNT(*) FROM documentftsdirty")).one()[0] == 0
+    response = client.get("/documents/search?q=tag2", headers=headers)
+    assert [r["title"] for r in response.json()["results"]] == ["Plain"]
+
+    # Editing a tag reindexes every document carrying it
+    response = client.patch(
+        f"/tags/{tags[0].id}", headers=headers, json={"description": "Sourdough"}
+    )
+    assert response.status_code == 200
+    response = client.get("/documents/search?q=sourdough&sort=created_at", headers=headers)
+    assert {r["title"] for r in response.json()["results"]} == {"Plain", "Other"}
+    response = client.get("/documents/search?q=label", headers=headers)
+    assert [r["title"] for r in response.json()["results"]] == ["Plain"]
+
+
+def test_search_documents_ranked_by_bm25(client: TestClient, session: Session):
+    # A content-only mention should rank below a title match
+    session.add_all(
+        [
+            Document(title="Cooking notes", content="Some tofu recipes"),
+            Document(title="Tofu", description="All about tofu", content="tofu"),
+            Document(title="Shopping", content="Buy milk"),
+        ]
+    )
+    session.commit()
+
+    response = client.get(
+        "/documents/search?q=tofu", headers={"X-API-Key": "dev_api_key"}
+    )
+    assert response.status_code == 200
+    results = response.json()
+    assert results["total"] == 2
+    assert [r["title"] for r in results["results"]] == ["Tofu", "Cooking notes"]
+
+
+def test_search_documents_interestingness_boost(
+    client: TestClient, session: Session, settings: Settings
+):
+    session.add_all(
+        [
+            Document(title="Tofu", content="tofu", interestingness=0),
+            Document(title="Tofu", content="tofu", interestingness=2),
+        ]
+    )
+    session.commit()
+
+    settings.search_interestingness_boost = 1.0
+    response = client.get(
+        "/documents/search?q=tofu", headers={"X-API-Key": "dev_api_key"}
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["interestingness"] for r in results] == [2, 0]
+
+
+def test_search_documents_cursor_pagination(client: TestClient, session: Session):
+    session.add_all(
+        [Document(title=f"Tofu {i}", content="tofu " * (i + 1)) for i in range(5)]
+    )
+    session.commit()
+    headers = {"X-API-Key": "dev_api_key"}
+
+    by_page = [
+        r["id"]
+        for page in (1, 2, 3)
+        for r in client.get(
+            f"/documents/search?q=tofu&page_size=2&page={page}", headers=headers
+        ).json()["results"]
+    ]
+
+    by_cursor = []
+    url = "/documents/search?q=tofu&page_size=2"
+    results = client.get(url, headers=headers).json()
+    while True:
+        by_cursor += [r["id"] for r in results["results"]]
+        if not results["next_cursor"]:
+            break
+        results = client.get(
+            f"{url}&cursor={results['next_cursor']}", headers=headers
+        ).json()
+
+    assert len(by_cursor) == 5
+    assert by_cursor == by_page
+
+
+def test_search_documents_invalid_cursor(client: TestClient):
+    response = client.get(
+        "/documents/search?q=tofu&cursor=bogus", headers={"X-API-Key": "dev_api_key"}
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_search_documents_cursor_keeps_sort_and_mode(
+    client: TestClient, session: Session
+):
+    session.add_all([Document(title=f"Tofu {i}", content="tofu") for i in range(3)])
+    session.commit()
+    headers = {"X-API-Key": "dev_api_key"}
+
+    url = "/documents/search?q=tofu&page_size=2"
+    cursor = client.get(f"{url}&sort=created_at", headers=headers).json()["next_cursor"]
+    for other in ("sort=relevance", "mode=substring"):
+        response = client.get(f"{url}&{other}&cursor={cursor}", headers=headers)
+        assert response.status_code == 400
+        assert "another sort or mode" in response.json()["detail"]
+    response = client.get(f"{url}&sort=created_at&cursor={cursor}", headers=headers)
+    assert len(response.json()["results"]) == 1
+
+
+def test_search_documents_count_modes(
+    client: TestClient, session: Session, settings: Settings
+):
+    session.add_all([Document(title=f"Tofu {i}", content="tofu") for i in range(5)])
+    session.commit()
+    headers = {"X-API-Key": "dev_api_key"}
+
+    results = client.get("/documents/search?q=tofu&count=none", headers=headers).json()
+    assert results["total"] is None
+    assert len(results["results"]) == 5
+
+    settings.search_count_cap = 3
+    results = client.get("/documents/search?q=tofu", headers=headers).json()
+    assert results["total"] == 3
+    assert results["total_capped"] is True
+
+    results = client.get("/documents/search?q=tofu&count=exact", headers=headers).json()
+    assert results["total"] == 5
+    assert results["total_capped"] is False
+
+
+def test_search_count_cache_invalidated_on_create(client: TestClient):
+    headers = {"X-API-Key": "dev_api_key"}
+    document_data = {"title": "Tofu", "content": "tofu"}
+
+    client.post("/documents/", headers=headers, json=document_data)
+    results = client.get("/documents/search?q=tofu&count=exact", headers=headers)
+    assert results.json()["total"] == 1
+
+    client.post("/documents/", headers=headers, json=document_data)
+    results = client.get("/documents/search?q=tofu&count=exact", headers=headers)
+    assert results.json()["total"] == 2
+
+
+def test_search_result_cache(client: TestClient, session: Session):
+    headers = {"X-API-Key": "dev_api_key"}
+    tag = Tag(name="soy", description="Soy products")
+    session.add_all([tag, Document(title="Tofu", content="tofu")])
+    session.commit()
+
+    before = client.get("/cache/stats", headers=headers).json()["search_results"]
+    first = client.get("/documents/search?q=tofu", headers=headers).json()
+    # Whitespace differences normalize to the same cache entry
+    second = client.get("/documents/search?q=%20tofu%20", headers=headers).json()
+    after = client.get("/cache/stats", headers=headers).json()["search_results"]
+    assert first == second
+    assert after["hits"] - before["hits"] == 1
+    assert after["misses"] - before["misses"] == 1
+
+    # Tagging the document is a write, so the cached page must not be reused
+    client.post(
+        f"/documents/{first['results'][0]['id']}/tags",
+        headers=headers,
+        json={"tag_ids": [tag.id]},
+    )
+    results = client.get("/documents/search?q=tofu", headers=headers).json()
+    assert [t["name"] for t in results["results"][0]["tags"]] == ["soy"]
+
+
+def test_search_documents_query_count_independent_of_page_size(
+    client: TestClient, engine, session: Session
+):
+    tags = [Tag(name=f"tag{i}") for i in range(3)]
+    session.add_all(
+        [Document(title=f"Tofu {i}", content="tofu", tags=tags) for i in range(10)]
+    )
+    session.commit()
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.get(
+            "/documents/search?q=tofu&count=none", headers={"X-API-Key": "dev_api_key"}
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    results = response.json()["results"]
+    assert len(results) == 10
+    assert all(len(r["tags"]) == 3 for r in results)
+    # The data version check, one ranked page query and one batched tag query
+    assert len(statements) == 3
+    assert "searchdataversion" in statements[0]
+    assert "document.content" not in statements[1]
+
+
+def test_search_caches_notice_writes_from_other_processes(
+    client: TestClient, session: Session
+):
+    session.add(Document(title="Tofu", content="tofu"))
+    session.commit()
+    headers = {"X-API-Key": "dev_api_key"}
+    assert client.get("/documents/search?q=tofu", headers=headers).json()["total"] == 1
+
+    # As an importer would, without going through the API
+    session.exec(
+        text(
+            "INSERT INTO document (title, content, created_at, updated_at) "
+            "VALUES ('More tofu', 'tofu', '2024-01-01', '2024-01-01')"
+        )
+    )
+    session.commit()
+    assert client.get("/documents/search?q=tofu", headers=headers).json()["total"] == 2
+
+
+def test_search_documents_min_interestingness(client: TestClient, session: Session):
+    session.add_all(
+        [
+            Document(title="Tofu 0", content="tofu", interestingness=0),
+            Document(title="Tofu 1", content="tofu", interestingness=1),
+            Document(title="Tofu 2", content="tofu", interestingness=2),
+            Document(title="Tofu", content="tofu"),
+        ]
+    )
+    session.commit()
+
+    response = client.get(
+        "/documents/search?q=tofu&min_interestingness=1",
+        headers={"X-API-Key": "dev_api_key"},
+    )
+    results = response.json()
+    assert results["total"] == 2
+    assert {r["title"] for r in results["results"]} == {"Tofu 1", "Tofu 2"}
+
+
+def test_search_documents_substring_mode(client: TestClient, session: Session):
+    session.add_all(
+        [
+            Document(title="Config", content="see https://example.com/api/v2 docs"),
+            Document(title="Notes", content="Zusammenfassung der Besprechung"),
+            Document(title="Other", content="nothing to see here"),
+        ]
+    )
+    session.commit()
+    headers = {"X-API-Key": "dev_api_key"}
+
+    # Fragments the unicode61 tokenizer can't match
+    results = client.get(
+        "/documents/search?q=ample.com/api&mode=substring", headers=headers
+    ).json()
+    assert [r["title"] for r in results["results"]] == ["Config"]
+
+    results = client.get(
+        "/documents/search?q=MMENFASS&mode=substring", headers=headers
+    ).json()
+    assert [r["title"] for r in results["results"]] == ["Notes"]
+
+    results = client.get("/documents/search?q=MMENFASS", headers=headers).json()
+    assert results["total"] == 0
+
+    # Whitespace is part of a substring query, also for the caches
+    session.add(Document(title="Tofu", content="silken tofu  dessert"))
+    session.commit()
+    for q, total in (
+        ("tofu%20dessert", 0),
+        ("tofu%20%20dessert", 1),
+        ("tofu%20dessert", 0),
+    ):
+        results = client.get(
+            f"/documents/search?q={q}&mode=substring", headers=headers
+        ).json()
+        assert results["total"] == total
+
+
+def test_search_documents_tag_filters_and_facets(client: TestClient, session: Session):
+    soy = Tag(name="soy")
+    recipe = Tag(name="recipe")
+    session.add_all(
+        [
+            Document(title="Tofu stew", content="tofu", tags=[soy, recipe]),
+            Document(title="Tofu facts", content="tofu", tags=[soy]),
+            Document(title="Tofu menu", content="tofu", tags=[recipe]),
+            Document(title="Tofu", content="tofu"),
+        ]
+    )
+    session.commit()
+    headers = {"X-API-Key": "dev_api_key"}
+
+    results = client.get(
+        f"/documents/search?q=tofu&tag_ids={soy.id}&tag_ids={recipe.id}",
+        headers=headers,
+    ).json()
+    assert [r["title"] for r in results["results"]] == ["Tofu stew"]
+
+    results = client.get(
+        f"/documents/search?q=tofu&exclude_tag_ids={recipe.id}", headers=headers
+    ).json()
+    assert {r["title"] for r in results["results"]} == {"Tofu facts", "Tofu"}
+
+    results = client.get(
+        f"/documents/search?q=tofu&tag_ids={soy.id}&facets=tags&page_size=1",
+        headers=headers,
+    ).json()
+    assert len(results["results"]) == 1
+    assert results["facets"]["tags"] == [
+        {"id": soy.id, "name": "soy", "count": 2},
+        {"id": recipe.id, "name": "recipe", "count": 1},
+    ]
+
+
+def test_search_documents_batch(client: TestClient, session: Session):
+    session.add_all(
+        [
+            Document(title="Tofu stew", content="tofu stew"),
+            Document(title="Bean stew", content="bean stew"),
+            Document(title="Tofu salad", content="tofu salad"),
+        ]
+    )
+    session.commit()
+    headers = {"X-API-Key": "dev_api_key"}
+    searches = [{"q": "tofu"}, {"q": "stew", "count": "exact"}]
+
+    response = client.post(
+        "/documents/search/batch", headers=headers, json={"searches": searches}
+    )
+    assert response.status_code == 200
+    responses = response.json()["responses"]
+    assert [len(r["results"]) for r in responses] == [2, 2]
+    assert responses[1]["total"] == 2
+
+    response = client.post(
+        "/documents/search/batch",
+        headers=headers,
+        json={"searches": searches, "deduplicate": True},
+    )
+    responses = response.json()["responses"]
+    assert {r["title"] for r in responses[0]["results"]} == {"Tofu stew", "Tofu salad"}
+    assert [r["title"] for r in responses[1]["results"]] == ["Bean stew"]
+
+    # Deduplicating must not alter the cached result of the second search
+    response = client.get("/documents/search?q=stew&count=exact", headers=headers)
+    assert len(response.json()["results"]) == 2
+
+
+def test_search_documents_batch_validates_specs(client: TestClient):
+    response = client.post(
+        "/documents/search/batch",
+        headers={"X-API-Key": "dev_api_key"},
+        json={"searches": [{"q": "to"}]},
+    )
+    assert response.status_code == 422
+
+
+def test_search_documents_hybrid_mode(client: TestClient, session: Session):
+    session.add_all(
+        [
+            Document(title="Dessert", content="silken curd with syrup"),
+            Document(title="Barbecue", content="a marinade for grilling"),
+            Document(title="Garage", content="engine repair"),
+        ]
+    )
+    session.commit()
+    headers = {"X-API-Key": "dev_api_key"}
+
+    # No document contains both words, so plain FTS finds nothing
+    results = client.get("/documents/search?q=curd marinade", headers=headers).json()
+    assert results["total"] == 0
+
+    results = client.get(
+        "/documents/search?q=curd marinade&mode=hybrid", headers=headers
+    ).json()
+    assert {r["title"] for r in results["results"]} == {"Dessert", "Barbecue"}
+
+
+def test_search_documents_hybrid_mode_ignores_query_syntax(
+    client: TestClient, session: Session
+):
+    session.add_all(
+        [
+            Document(title="Dessert", content="silken tofu with syrup"),
+            Document(title="Templates", content="C++ tips and tricks"),
+        ]
+    )
+    session.commit()
+    headers = {"X-API-Key": "dev_api_key"}
+
+    for q, title in [
+        ("what about tofu?", "Dessert"),
+        ("C++ tips", "Templates"),
+        ('"unbalanced (quote* AND', None),
+        ("?!?", None),
+    ]:
+        response = client.get(
+            "/documents/search", params={"q": q, "mode": "hybrid"}, headers=headers
+        )
+        assert response.status_code == 200, q
+        if title:
+            assert response.json()["results"][0]["title"] == title
+
+
+def test_search_documents_hybrid_embeddings_follow_edits(
+    client: TestClient, session: Session
+):
+    document = Document(title="Notes", content="engine repair")
+    session.add(document)
+    session.commit()
+    headers = {"X-API-Key": "dev_api_key"}
+    url = "/documents/search?q=sourdough&mode=hybrid&count=none"
+
+    assert client.get(url, headers=headers).json()["results"] == []
+
+    document.content = "sourdough starter feeding schedule"
+    session.add(document)
+    session.commit()
+    invalidate_search_caches()
+
+    results = client.get(url, headers=headers).json()["results"]
+    assert [r["title"] for r in results] == ["Notes"]
+
+
+def test_export_documents(client: TestClient, session: Session):
+    soy = Tag(name="soy")
+    session.add_all(
+        [
+            Document(title="Tofu", content="tofu " * 1000, tags=[soy]),
+            Document(title="Cars", content="engine repair", interestingness=2),
+        ]
+    )
+    session.commit()
+    headers = {"X-API-Key": "dev_api_key"}
+
+    response = client.get("/documents/export", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    documents = [json.loads(line) for line in response.text.splitlines()]
+    assert [d["title"] for d in documents] == ["Tofu", "Cars"]
+    assert documents[0]["content"] == "tofu " * 1000
+    assert [t["name"] for t in documents[0]["tags"]] == ["soy"]
+
+    response = client.get("/documents/export?q=engine&gzip=true", headers=headers)
+    assert response.headers["content-encoding"] == "gzip"
+    documents = [json.loads(line) for line in response.text.splitlines()]
+    assert [d["title"] for d in documents] == ["Cars"]
+
+    response = client.get("/documents/export?min_interestingness=1", headers=headers)
+    assert [json.loads(line)["title"] for line in response.text.splitlines()] == [
+        "Cars"
+    ]
+
+
+def test_export_documents_in_batches(client: TestClient, session: Session):
+    session.add_all([Document(title=f"Tofu {i}", content="tofu") for i in range(5)])
+    session.commit()
+    headers = {"X-API-Key": "dev_api_key"}
+
+    with mock.patch("app.main.EXPORT_BATCH_SIZE", 2):
+        response = client.get("/documents/export?q=tofu", headers=headers)
+    assert [json.loads(line)["title"] for line in response.text.splitlines()] == [
+        f"Tofu {i}" for i in range(5)
+    ]
+
+    # Reported before the stream starts, not as an empty 200
+    response = client.get("/documents/export?q=tofu?", headers=headers)
+    assert response.status_code == 400
+
+
+def test_search_documents_by_date(client: TestClient, session: Session):
+    session.add_all(
+        [
+            Document(
+                title=f"Tofu {month}",
+                content="tofu",
+                created_at=datetime(2024, month, 15),
+            )
+            for month in (1, 2, 3, 4)
+        ]
+    )
+    session.commit()
+    headers = {"X-API-Key": "dev_api_key"}
+
+    results = client.get(
+        "/documents/search?q=tofu&created_after=2024-02-01&created_before=2024-04-01",
+        headers=headers,
+    ).json()
+    assert results["total"] == 2
+    assert {r["title"] for r in results["results"]} == {"Tofu 2", "Tofu 3"}
+
+    titles = []
+    url = "/documents/search?q=tofu&sort=created_at&page_size=3"
+    results = client.get(url, headers=headers).json()
+    titles += [r["title"] for r in results["results"]]
+    results = client.get(
+        f"{url}&cursor={results['next_cursor']}", headers=headers
+    ).json()
+    titles += [r["title"] for r in results["results"]]
+    assert titles == ["Tofu 4", "Tofu 3", "Tofu 2", "Tofu 1"]
+
+    response = client.get(
+        "/documents/export?created_before=2024-02-01", headers=headers
+    )
+    assert [json.loads(line)["title"] for line in response.text.splitlines()] == [
+        "Tofu 1"
+    ]
+
+
+def test_create_documents_bulk(client: TestClient, session: Session):
+    tag = Tag(name="soy")
+    session.add(tag)
+    session.commit()
+    headers = {"X-API-Key": "dev_api_key"}
+
+    response = client.post(
+        "/documents/bulk",
+        headers=headers,
+        json=[
+            {"title": "Tofu", "content": "tofu", "tag_ids": [tag.id]},
+            {"title": "Missing content"},
+            {"title": "Bad tag", "content": "x", "tag_ids": [999]},
+            {"title": "Tempeh", "content": "tempeh", "interestingness": 2},
+        ],
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["created"], body["failed"]) == (2, 2)
+    results = body["results"]
+    assert results[1]["error"] == "content: Field required"
+    assert results[2]["error"] == "One or more tag IDs do not exist"
+    assert results[1]["id"] is None and results[2]["id"] is None
+
+    document = client.get(f"/documents/{results[0]['id']}", headers=headers).json()
+    assert [t["name"] for t in document["tags"]] == ["soy"]
+
+    # Bulk inserts are indexed like single ones
+    results = client.get("/documents/search?q=soy", headers=headers).json()
+    assert [r["title"] for r in results["results"]] == ["Tofu"]
+
+
+def test_create_documents_bulk_ndjson(client: TestClient):
+    lines = [json.dumps({"title": f"Note {i}", "content": "tofu"}) for i in range(3)]
+    response = client.post(
+        "/documents/bulk",
+        headers={"X-API-Key": "dev_api_key", "Content-Type": "application/x-ndjson"},
+        content="\n".join(lines) + "\n",
+    )
+    assert response.json()["created"] == 3
+
+    # A malformed line fails on its own, like a schema-invalid item
+    lines.insert(1, "{nope")
+    response = client.post(
+        "/documents/bulk",
+        headers={"X-API-Key": "dev_api_key", "Content-Type": "application/x-ndjson"},
+        content="\n".join(lines),
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["created"], body["failed"]) == (3, 1)
+    assert body["results"][1]["error"].startswith("Invalid JSON")
+    assert body["results"][1]["id"] is None
+    assert all(result["id"] for i, result in enumerate(body["results"]) if i != 1)
+
+    response = client.post(
+        "/documents/bulk", headers={"X-API-Key": "dev_api_key"}, content="{nope"
+    )
+    assert response.status_code == 400
+
+
+def test_fts_stats_and_merge(client: TestClient, session: Session):
+    for i in range(3):
+        session.add(Document(title=f"Tofu {i}", content="silken tofu"))
+        session.commit()
+
+    response = client.get("/fts/stats", headers={"X-API-Key": "dev_api_key"})
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["segments"] == 3
+    assert stats["automerge"] == 4
+    assert stats["last_merged_at"] is None
+
+    response = client.post("/fts/merge?pages=100", headers={"X-API-Key": "dev_api_key"})
+    assert response.status_code == 200
+    merged = response.json()
+    assert merged["merged"] is True
+    assert merged["segments"] == 1
+    assert merged["last_optimized_at"] is not None
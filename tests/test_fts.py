@@ -0,0 +1,194 @@
+from unittest import mock
+
+from sqlmodel import Session, create_engine, select, text
+from sqlmodel.pool import StaticPool
+import pytest
+
+from app import fts
+from app.fts import configure_index, index_stats, merge_index
+from app.config import Settings
+from app.main import create_db_and_tables
+from app.models import Document, Tag
+
+
+@pytest.fixture(name="engine")
+def engine_fixture():
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    create_db_and_tables(engine)
+    return engine
+
+
+def check_index(session):
+    # Raises if the index doesn't match what the content view supplies
+    session.exec(text("INSERT INTO documentfts(documentfts, rank) VALUES ('integrity-check', 1)"))
+
+
+def matches(session, query):
+    return session.exec(
+        text("SELECT rowid FROM documentfts WHERE documentfts MATCH :q ORDER BY rowid"),
+        params={"q": query},
+    ).all()
+
+
+def test_external_content_index_stays_consistent(engine):
+    with Session(engine) as session:
+        food = Tag(name="food", description="Cooking")
+        cars = Tag(name="cars", description=None)
+        tofu = Document(title="Tofu", content="silken tofu dessert", tags=[food])
+        engine_doc = Document(title="Engines", description="Repair", content="oil")
+        session.add_all([tofu, engine_doc])
+        session.commit()
+        check_index(session)
+        assert matches(session, "cooking") == [(tofu.id,)]
+
+        # Text and tag changes in the same transaction
+        tofu.content = "firm tofu stir fry"
+        tofu.tags.append(cars)
+        engine_doc.tags.append(food)
+        session.commit()
+        check_index(session)
+        assert matches(session, "silken") == []
+        assert matches(session, "stir AND cars") == [(tofu.id,)]
+        assert matches(session, "cooking") == [(tofu.id,), (engine_doc.id,)]
+
+        food.description = "Baking"
+        session.commit()
+        check_index(session)
+        assert matches(session, "cooking") == []
+        assert matches(session, "baking") == [(tofu.id,), (engine_doc.id,)]
+
+        session.delete(tofu)
+        session.commit()
+        check_index(session)
+        assert matches(session, "baking") == [(engine_doc.id,)]
+        assert session.exec(text("SELECT document_id FROM documentftstags")).all() == [
+            (engine_doc.id,)
+        ]
+
+
+def test_new_documents_are_indexed_once_at_commit(engine):
+    with Session(engine) as session:
+        food = Tag(name="food", description="Cooking")
+        tofu = Document(title="Tofu", content="silken tofu", tags=[food])
+        session.add(tofu)
+        session.flush()
+        # Only queued until the transaction commits, then indexed with tags
+        assert matches(session, "silken") == []
+        session.commit()
+        assert matches(session, "silken AND cooking") == [(tofu.id,)]
+        check_index(session)
+
+        # Added, edited and removed again before ever being indexed
+        draft = Document(title="Draft", content="first words")
+        session.add(draft)
+        session.flush()
+        draft.content = "second words"
+        session.flush()
+        session.delete(draft)
+        session.commit()
+        check_index(session)
+        assert matches(session, "words") == []
+
+
+def test_interestingness_edits_do_not_reindex(engine):
+    with Session(engine) as session:
+        tofu = Document(title="Tofu", content="silken tofu")
+        session.add(tofu)
+        session.commit()
+
+        def total_changes():
+            return session.exec(text("SELECT total_changes()")).one()[0]
+
+        before = total_changes()
+        session.exec(
+            text("UPDATE document SET interestingness = 2 WHERE id = :id"),
+            params={"id": tofu.id},
+        )
+        # The document row and the search data version, no index rows
+        assert total_changes() - before == 2
+        check_index(session)
+
+
+def test_index_does_not_store_document_text(engine):
+    with Session(engine) as session:
+        session.add(Document(title="Tofu", content="silken tofu dessert"))
+        session.commit()
+        tables = {
+            name
+            for name, in session.exec(
+                text("SELECT name FROM sqlite_master WHERE name LIKE 'documentfts%'")
+            )
+        }
+        assert "documentfts_content" not in tables
+        assert session.exec(select(Document)).one().title == "Tofu"
+
+
+def test_merge_index_defragments(engine):
+    with Session(engine) as session:
+        # Without automerge every commit leaves another segment behind
+        configure_index(session.connection(), automerge=0, crisismerge=64)
+        session.commit()
+        for i in range(20):
+            session.add(Document(title=f"Tofu {i}", content="silken tofu"))
+            session.commit()
+        stats = index_stats(session.connection())
+        assert stats["segments"] == 20
+        assert stats["automerge"] == 0
+        assert stats["last_optimized_at"] is None
+
+        assert merge_index(session.connection(), pages=1000)
+        session.commit()
+        stats = index_stats(session.connection())
+        assert stats["segments"] == 1
+        assert stats["last_merged_at"] == stats["last_optimized_at"] is not None
+        assert not merge_index(session.connection(), pages=1000)
+        check_index(session)
+        assert len(matches(session, "silken")) == 20
+
+
+def test_index_stats_survive_unknown_structure_format(engine, monkeypatch):
+    with Session(engine) as session:
+        configure_index(session.connection(), automerge=0, crisismerge=64)
+        session.commit()
+        for i in range(3):
+            session.add(Document(title=f"Tofu {i}", content="silken tofu"))
+            session.commit()
+        block = session.exec(
+            text("SELECT block FROM documentfts_data WHERE id = 10")
+        ).one()[0]
+        # As if a future SQLite changed the layout behind the version marker
+        monkeypatch.setattr(fts, "STRUCTURE_V2", block[4:8])
+
+        stats = index_stats(session.connection())
+        assert stats["levels"] is None
+        assert stats["segments"] == 3
+
+        assert merge_index(session.connection(), pages=1000)
+        session.commit()
+        stats = index_stats(session.connection())
+        assert stats["segments"] == 1
+        assert stats["last_optimized_at"] is not None
+        assert not merge_index(session.connection(), pages=1000)
+
+
+def test_prefix_lengths_follow_settings():
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    settings = Settings(database_url="sqlite:///:memory:", fts_prefix_lengths=[1, 3])
+    with mock.patch("app.main.get_settings", return_value=settings):
+        create_db_and_tables(engine)
+    with Session(engine) as session:
+        sql = session.exec(
+            text("SELECT sql FROM sqlite_master WHERE name = 'documentfts'")
+        ).one()[0]
+        assert "prefix='1 3'" in sql
+        session.add(Document(title="Tofu", content="silken tofu"))
+        session.commit()
+        assert len(matches(session, "s*")) == 1
@@ -0,0 +1,139 @@
+import io
+import json
+
+from sqlmodel import Session, create_engine, text
+from sqlmodel.pool import StaticPool
+import pytest
+
+from app.main import create_db_and_tables
+from utils import load_data as load_data_module
+from utils.json_stream import iter_array, iter_object
+
+
+@pytest.fixture(name="engine")
+def engine_fixture(monkeypatch):
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    create_db_and_tables(engine)
+    monkeypatch.setattr(load_data_module, "engine", engine)
+    return engine
+
+
+@pytest.fixture(name="json_file")
+def json_file_fixture(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text(
+        json.dumps(
+            {
+                "tags": {"python": "Python programming language", "food": None},
+                "documents": [
+                    {
+                        "title": "FastAPI intro",
+                        "description": "Building APIs",
+                        "content": "Routing and dependencies",
+                        "tags": ["python"],
+                    },
+                    {
+                        "title": "Tofu",
+                        "description": None,
+                        "content": "Silken tofu dessert",
+                        "tags": ["food", "python"],
+                    },
+                ],
+            }
+        )
+    )
+    return path
+
+
+def fts_rows(engine):
+    with Session(engine) as session:
+        return session.exec(
+            text(
+                "SELECT rowid, title, description, content, tag_data "
+                "FROM documentfts ORDER BY rowid"
+            )
+        ).all()
+
+
+def test_bulk_load_matches_row_by_row_indexing(engine, json_file):
+    load_data_module.load_data(json_file)
+    expected = fts_rows(engine)
+
+    load_data_module.load_data(json_file, bulk=True, batch_size=1)
+    rows = fts_rows(engine)
+    assert len(rows) == 4
+    assert [row[1:] for row in rows[2:]] == [row[1:] for row in expected]
+
+    with Session(engine) as session:
+        # Tags are reused, and the indexing triggers are back in place
+        assert session.exec(text("SELECT COUNT(*) FROM tag")).one()[0] == 2
+        triggers = session.exec(
+            text("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        ).all()
+        assert {"document_ai", "documenttag_ai"} <= {name for name, in triggers}
+        assert session.exec(
+            text("SELECT COUNT(*) FROM documentfts_trigram WHERE documentfts_trigram MATCH 'ilke'")
+        ).one()[0] == 2
+        assert session.exec(text("SELECT COUNT(*) FROM documentembedding")).one()[0] == 4
+        assert session.exec(text("PRAGMA synchronous")).one()[0] != 0
+
+
+def test_failed_bulk_load_keeps_indexing_triggers(engine, tmp_path):
+    path = tmp_path / "bad.json"
+    path.write_text(
+        json.dumps(
+            {
+                "tags": {"python": None},
+                "documents": [
+                    {"title": "Ok", "description": None, "content": "x", "tags": []},
+                    {"title": "Bad", "description": None, "content": "y", "tags": ["nope"]},
+                ],
+            }
+        )
+    )
+    with pytest.raises(KeyError):
+        load_data_module.load_data(path, bulk=True)
+
+    with Session(engine) as session:
+        assert session.exec(text("SELECT COUNT(*) FROM document")).one()[0] == 0
+        assert session.exec(text("SELECT COUNT(*) FROM tag")).one()[0] == 0
+        triggers = {
+            name
+            for name, in session.exec(
+                text("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+            )
+        }
+        assert set(load_data_module.INDEXING_TRIGGERS) <= triggers
+
+
+def test_json_stream_reads_values_split_across_chunks():
+    data = {
+        "tags": {"python": "x" * 50, "food": None},
+        "documents": [{"title": f"Doc {i}", "score": i * 1.5} for i in range(20)],
+        "count": 1234567,
+    }
+    for chunk_size in (1, 3, 1024):
+        members = {}
+        for key, value in iter_object(
+            io.StringIO(json.dumps(data, indent=2)),
+            streamed=("documents",),
+            chunk_size=chunk_size,
+        ):
+            members[key] = list(value) if key == "documents" else value
+        assert members == data
+
+    # Unconsumed streamed arrays are skipped
+    keys = [key for key, _ in iter_object(io.StringIO(json.dumps(data)), ("documents",))]
+    assert keys == ["tags", "documents", "count"]
+    assert list(iter_array(io.StringIO(" [1, 22 ,333] "), chunk_size=2)) == [1, 22, 333]
+
+
+def test_load_data_requires_tags_before_documents(engine, tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps({"documents": [], "tags": {}}))
+    with pytest.raises(ValueError):
+        load_data_module.load_data(path)
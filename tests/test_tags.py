@@ -5,6 +5,8 @@ import pytest
 from unittest import mock
 from app.main import app, get_session, create_db_and_tables
 from app.models import Tag
+from app.tags import tag_resolver
+from sqlalchemy import event
 from app.config import Settings
 
 @pytest.fixture(name="settings")
@@ -81,6 +83,14 @@ def test_create_tag(client: TestClient):
     assert created_tag["description"] == tag_data["description"]
     assert "id" in created_tag
 
+def test_create_tag_duplicate_name(client: TestClient):
+    tag_data = {"name": "docker", "description": "Docker containers"}
+    headers = {"X-API-Key": "dev_api_key"}
+    assert client.post("/tags/", headers=headers, json=tag_data).status_code == 201
+    response = client.post("/tags/", headers=headers, json=tag_data)
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Tag already exists"
+
 def test_update_tag_description(client: TestClient, session: Session):
     # Create test tag
     tag = Tag(name="python", description="Old description")
@@ -118,3 +128,34 @@ def test_create_tag_unauthorized(client: TestClient):
     response = client.post("/tags/", json=tag_data)
     assert response.status_code == 403
     assert response.json()["detail"] == "Not authenticated"
+
+
+def test_tag_resolver_survives_read_only_sessions(engine):
+    with Session(engine) as session:
+        ids = tag_resolver.resolve(session.connection(), {"python": "Python"})
+        session.commit()
+
+    # Closing a session that only read rolls back, which must not drop the map
+    with Session(engine) as session:
+        session.get(Tag, ids["python"])
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        with engine.connect() as connection:
+            assert tag_resolver.resolve(connection, {"python": None}) == ids
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert statements == []
+
+    with Session(engine) as session:
+        created = tag_resolver.resolve(session.connection(), {"rust": "Rust"})
+        session.rollback()
+        assert session.get(Tag, created["rust"]) is None
+        # The rolled back tag is created again rather than answered from the map
+        created = tag_resolver.resolve(session.connection(), {"rust": "Rust"})
+        assert session.get(Tag, created["rust"]).name == "rust"
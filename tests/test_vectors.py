@@ -0,0 +1,80 @@
+from sqlmodel import Session, create_engine
+from sqlmodel.pool import StaticPool
+import pytest
+
+from app.main import create_db_and_tables
+from app.models import Document
+from app.vectors import HashingEmbedder, VectorIndex
+
+
+@pytest.fixture(name="engine")
+def engine_fixture():
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    create_db_and_tables(engine)
+    return engine
+
+
+def test_hashing_embedder_is_deterministic_and_normalized():
+    embedder = HashingEmbedder(dim=64)
+    first, second, empty = embedder.embed(["Tofu recipes", "tofu RECIPES", ""])
+    assert (first == second).all()
+    assert abs(float(first @ first) - 1.0) < 1e-6
+    assert not empty.any()
+
+
+def test_vector_index_persists_and_syncs_incrementally(engine, tmp_path):
+    with Session(engine) as session:
+        tofu = Document(title="Tofu", content="silken tofu dessert")
+        session.add_all([tofu, Document(title="Cars", content="engine repair")])
+        session.commit()
+
+        index = VectorIndex(tmp_path / "vectors")
+        index.sync(session.connection())
+        query = HashingEmbedder().embed(["tofu dessert"])[0]
+        assert index.search(query, 1)[0][0] == tofu.id
+
+        # A fresh index over the same directory starts from the saved state
+        reopened = VectorIndex(tmp_path / "vectors")
+        assert reopened.count == 2
+        assert reopened.search(query, 1)[0][0] == tofu.id
+
+        tofu.content = "engine oil"
+        session.add(tofu)
+        session.add(Document(title="Dessert", content="tofu dessert"))
+        session.commit()
+        reopened.sync(session.connection())
+        assert reopened.count == 3
+        assert [id for id, _ in reopened.search(query, 1)] == [3]
+
+
+def test_vector_index_drops_deleted_documents(engine):
+    with Session(engine) as session:
+        apples = Document(title="Apples", content="crisp apples")
+        bananas = Document(title="Bananas", content="ripe bananas")
+        session.add_all([apples, bananas])
+        session.commit()
+        index = VectorIndex()
+        index.sync(session.connection())
+
+        # The new document reuses the deleted one's id, and its embedding
+        # must not reuse the deleted embedding's version
+        session.delete(bananas)
+        session.commit()
+        cherries = Document(title="Cherries", content="sour cherries")
+        session.add(cherries)
+        session.commit()
+        assert cherries.id == 2
+        index.sync(session.connection())
+        query = HashingEmbedder().embed(["cherries"])[0]
+        (id_, similarity), _ = index.search(query, 2)
+        assert id_ == cherries.id and similarity > 0.5
+
+        session.delete(apples)
+        session.commit()
+        index.sync(session.connection())
+        assert index.count == 1
+        assert [id_ for id_, _ in index.search(query, 5)] == [cherries.id]
@@ -0,0 +1,116 @@
+"""
+Incremental JSON reading for imports too large to `json.load` in one go.
+
+Only the outer container is parsed by hand; every member value is decoded
+with the standard library decoder once enough input has been buffered, so
+memory is bounded by the largest single value rather than the whole file.
+"""
+import json
+from typing import Any, Container, IO, Iterator, Tuple
+
+WHITESPACE = " \t\n\r"
+
+_decoder = json.JSONDecoder()
+
+
+class JSONStream:
+    def __init__(self, f: IO[str], chunk_size: int = 1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size: int) -> bool:
+        """Drop consumed input and read up to `size` more characters"""
+        if self.eof:
+            return False
+        chunk = self.f.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """Skip whitespace and return the next character, or '' at the end"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill(self.chunk_size):
+                return ""
+
+    def _expect(self, chars: str) -> str:
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expected one of {chars!r} in JSON input, got {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value"""
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Truncated value; grow the buffer geometrically so large
+                # values are not re-scanned once per chunk
+                if not self._fill(max(self.chunk_size, len(self.buffer))):
+                    raise
+                continue
+            if end == len(self.buffer) and self._fill(self.chunk_size):
+                # A number or literal may continue in the next chunk
+                continue
+            self.pos = end
+            return value
+
+    def iter_array(self) -> Iterator[Any]:
+        """Yield the elements of the array starting at the current position"""
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self._expect(",]") == "]":
+                return
+
+    def iter_object(self, streamed: Container[str] = ()) -> Iterator[Tuple[str, Any]]:
+        """
+        Yield the (key, value) members of the object starting at the current
+        position. Values of keys in `streamed` must be arrays and are yielded
+        as iterators over their elements; whatever the caller leaves
+        unconsumed is skipped before the next member is read.
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self._expect(":")
+            if key in streamed:
+                items = self.iter_array()
+                yield key, items
+                for _ in items:
+                    pass
+            else:
+                yield key, self.value()
+            if self._expect(",}") == "}":
+                return
+
+
+def iter_array(f: IO[str], chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """Yield the elements of a file holding one top-level JSON array"""
+    return JSONStream(f, chunk_size).iter_array()
+
+
+def iter_object(
+    f: IO[str], streamed: Container[str] = (), chunk_size: int = 1 << 16
+) -> Iterator[Tuple[str, Any]]:
+    """Yield the members of a file holding one top-level JSON object"""
+    return JSONStream(f, chunk_size).iter_object(streamed)
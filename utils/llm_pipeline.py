@@ -0,0 +1,245 @@
+"""
+Helpers for calling an `llm` model from many threads: a shared token-bucket
+rate limiter, a wrapper that retries failed prompts with backoff, an
+on-disk cache of replies and a token budget for long texts.
+"""
+import hashlib
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average, with bursts of up to
+    `capacity`. Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float = 1,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self.sleep(wait)
+
+
+# Rough average for English text with OpenAI tokenizers; estimates only
+# need to keep prompts comfortably inside the context window
+CHARS_PER_TOKEN = 4
+
+OMITTED = "\n[...]\n"
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+class TokenBudget(NamedTuple):
+    """
+    Caps the text sent to the model at about `total` tokens: the first and
+    last `edge` tokens, plus evenly spaced `window`-token excerpts from the
+    middle. Excerpts are chosen deterministically, so the same text always
+    fits to the same prompt (and cache key).
+    """
+
+    total: int = 8000
+    edge: int = 1000
+    window: int = 250
+
+    def fit(self, messages: List[str]) -> Tuple[List[str], bool]:
+        """Return `messages`, or an abridged version of them, and whether they were cut"""
+        if self.edge < 0 or self.window < 1:
+            raise ValueError("Token budget edge must be >= 0 and window >= 1")
+        if self.total * CHARS_PER_TOKEN <= len(OMITTED):
+            raise ValueError(f"Token budget of {self.total} is too small")
+        text = "\n".join(messages)
+        if estimate_tokens(text) <= self.total:
+            return messages, False
+        edge = min(self.edge, self.total // 3) * CHARS_PER_TOKEN
+        # Not text[edge:-edge], which is empty when edge is 0
+        middle = text[edge : len(text) - edge]
+        # What's left once the edges and one omission marker are in
+        middle_chars = self.total * CHARS_PER_TOKEN - 2 * edge - len(OMITTED)
+        window = min(self.window * CHARS_PER_TOKEN, middle_chars)
+        count = middle_chars // (window + len(OMITTED)) if window > 0 else 0
+        pieces = [text[:edge]]
+        if count:
+            stride = len(middle) / count
+            for i in range(count):
+                start = int(i * stride + (stride - window) / 2)
+                pieces.append(middle[start : start + window])
+        # Not text[-edge:], which is the whole text when edge is 0
+        pieces.append(text[len(text) - edge :])
+        return [OMITTED.join(pieces)], True
+
+
+class Reply:
+    """The already-fetched text of a prompt, shaped like an `llm` response"""
+
+    def __init__(self, text: str):
+        self._text = text
+
+    def text(self) -> str:
+        return self._text
+
+
+class ReliableModel:
+    """
+    Wraps an `llm` model (or anything with `prompt(text).text()`), taking a
+    token from `limiter` before every request and retrying failures with
+    exponential backoff and jitter. `prompt` blocks until the reply is in.
+    """
+
+    def __init__(
+        self,
+        model,
+        limiter: TokenBucket,
+        attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.model = model
+        self.limiter = limiter
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.model_id = getattr(model, "model_id", type(model).__name__)
+
+    def prompt(self, prompt: str) -> Reply:
+        for attempt in range(self.attempts):
+            self.limiter.acquire()
+            try:
+                return Reply(self.model.prompt(prompt).text())
+            except Exception as e:
+                if attempt == self.attempts - 1:
+                    raise
+                delay = min(self.max_delay, self.base_delay * 2**attempt)
+                delay *= random.uniform(0.5, 1.0)
+                print(f"Model error ({e}); retrying in {delay:.1f}s")
+                self.sleep(delay)
+
+
+class ResponseCache:
+    """
+    Model replies stored in a SQLite file, keyed by model, prompt (name and
+    template version) and a hash of the content the prompt was built from.
+    Least recently used replies are evicted once the stored text exceeds
+    `max_bytes`. Safe to share between threads.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS response (
+                model TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                reply TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, prompt, content_hash)
+            )
+            """
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS ix_response_last_used ON response (last_used)"
+        )
+        self._db.commit()
+        self._size = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM response"
+        ).fetchone()[0]
+
+    @staticmethod
+    def _hash(content: str) -> str:
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def get(self, model: str, prompt: str, content: str) -> Optional[str]:
+        key = (model, prompt, self._hash(content))
+        with self._lock:
+            row = self._db.execute(
+                "SELECT reply FROM response "
+                "WHERE model = ? AND prompt = ? AND content_hash = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute(
+                "UPDATE response SET last_used = ? "
+                "WHERE model = ? AND prompt = ? AND content_hash = ?",
+                (time.time(), *key),
+            )
+            self._db.commit()
+            return row[0]
+
+    def set(self, model: str, prompt: str, content: str, reply: str) -> None:
+        key = (model, prompt, self._hash(content))
+        size = len(reply.encode())
+        with self._lock:
+            previous = self._db.execute(
+                "SELECT size FROM response "
+                "WHERE model = ? AND prompt = ? AND content_hash = ?",
+                key,
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO response VALUES (?, ?, ?, ?, ?, ?)",
+                (*key, reply, size, time.time()),
+            )
+            self._size += size - (previous[0] if previous else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self) -> None:
+        """Drop least recently used replies until 90% of max_bytes is left"""
+        target = self.max_bytes * 0.9
+        rows = self._db.execute(
+            "SELECT rowid, size FROM response ORDER BY last_used"
+        ).fetchall()
+        evicted = []
+        for rowid, size in rows:
+            if self._size <= target:
+                break
+            evicted.append((rowid,))
+            self._size -= size
+        self._db.executemany("DELETE FROM response WHERE rowid = ?", evicted)
+
+    def stats(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses"
+
+    def close(self) -> None:
+        self._db.close()
@@ -1,12 +1,28 @@
-import json
+import argparse
 import sys
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
-from sqlmodel import Session, select
-from app.models import Tag, Document
+from typing import Iterable
+from sqlalchemy import bindparam, insert, text
+from sqlmodel import Session
+from app.config import get_settings
+from app.models import Tag, Document, DocumentTag
+from app.fts import index_documents
 from app.main import engine, create_db_and_tables
+from app.tags import tag_resolver
+from app.vectors import backfill_embeddings
+from utils.json_stream import iter_object
 
+# Connection settings that trade durability for speed while a bulk load runs
+BULK_PRAGMAS = {"synchronous": "OFF", "cache_size": "-262144", "temp_store": "MEMORY"}
 
-def load_data(json_file: Path):
+# Triggers that index each row as it is inserted; bulk loads drop them and
+# index all new documents in one statement afterwards
+INDEXING_TRIGGERS = ("document_ai", "documenttag_ai", "document_trigram_ai")
+
+
+def load_data(json_file: Path, bulk: bool = False, batch_size: int = 1000):
     """
     Load documents and tags from a JSON file into the database.
     Expected JSON format:
@@ -26,60 +42,196 @@ def load_data(json_file: Path):
             ...
         ]
     }
+
+    The file is read incrementally: `tags` is decoded as a whole, then
+    `documents` is read one entry at a time and written in batches of
+    `batch_size`, so `tags` must come before `documents`.
     """
     # Create tables if they don't exist
-    create_db_and_tables()
+    create_db_and_tables(engine)
 
-    with Session(engine) as session:
-        # Load JSON data
-        with open(json_file) as f:
-            data = json.load(f)
+    with open(json_file, encoding="utf-8") as f:
+        tags = None
+        for key, value in iter_object(f, streamed=("documents",)):
+            if key == "tags":
+                tags = value
+            elif key == "documents":
+                if tags is None:
+                    raise ValueError(f"{json_file}: 'tags' must come before 'documents'")
+                if bulk:
+                    bulk_load(tags, value, batch_size)
+                else:
+                    load_documents(tags, value, batch_size)
 
+
+def load_documents(tags: dict, documents: Iterable[dict], batch_size: int = 1000):
+    """Add `documents` through the ORM, committing every `batch_size`"""
+    with Session(engine) as session:
         # Create tags first
-        tag_map = {}  # Map tag names to Tag objects
-        for tag_name, description in data["tags"].items():
-            # Check if tag already exists
-            existing_tag = session.exec(
-                select(Tag).where(Tag.name == tag_name)
-            ).first()
-            
-            if existing_tag:
-                tag_map[tag_name] = existing_tag
-            else:
-                tag = Tag(name=tag_name, description=description)
-                session.add(tag)
-                session.commit()
-                session.refresh(tag)
-                tag_map[tag_name] = tag
+        tag_ids = tag_resolver.resolve(session.connection(), tags)
+        tag_map = {  # Map tag names to Tag objects
+            tag_name: session.get(Tag, tag_id) for tag_name, tag_id in tag_ids.items()
+        }
 
         # Create documents
-        for doc_data in data["documents"]:
-            # Get Tag objects for this document
-            doc_tags = [tag_map[tag_name] for tag_name in doc_data["tags"]]
-            
-            # Create document
-            document = Document(
-                title=doc_data["title"],
-                description=doc_data["description"],
-                content=doc_data["content"],
-                tags=doc_tags
-            )
-            session.add(document)
-        
-        session.commit()
+        for batch in batched(documents, batch_size):
+            for doc_data in batch:
+                # Get Tag objects for this document
+                doc_tags = [tag_map[tag_name] for tag_name in doc_data["tags"]]
+
+                # Create document
+                document = Document(
+                    title=doc_data["title"],
+                    description=doc_data["description"],
+                    content=doc_data["content"],
+                    tags=doc_tags
+                )
+                session.add(document)
+
+            # Committed documents are only weakly referenced by the session,
+            # so memory stays bounded by one batch
+            session.commit()
+
+
+@contextmanager
+def bulk_pragmas(connection):
+    """Apply BULK_PRAGMAS for the duration of the block, then restore them"""
+    previous = {
+        name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+        for name in BULK_PRAGMAS
+    }
+    for name, value in BULK_PRAGMAS.items():
+        connection.exec_driver_sql(f"PRAGMA {name} = {value}")
+    connection.commit()
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            connection.exec_driver_sql(f"PRAGMA {name} = {value}")
+        connection.commit()
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def bulk_load(tags: dict, documents: Iterable[dict], batch_size: int = 1000):
+    """
+    Load `tags` and `documents` (see `load_data`) in one transaction with the per-row
+    indexing triggers dropped, then build the FTS rows for every new document
+    with one INSERT ... SELECT and restore the triggers. Meant for large
+    initial loads while nothing else is writing.
+    """
+    with engine.connect() as connection, bulk_pragmas(connection):
+        triggers = []
+        try:
+            with connection.begin():
+                # pysqlite only opens a transaction before DML, so without
+                # this the DROP TRIGGERs below would commit on their own and
+                # outlive a failed load
+                connection.exec_driver_sql("BEGIN")
+                triggers = connection.execute(
+                    text(
+                        "SELECT name, sql FROM sqlite_master "
+                        "WHERE type = 'trigger' AND name IN :names"
+                    ).bindparams(bindparam("names", expanding=True)),
+                    {"names": INDEXING_TRIGGERS},
+                ).all()
+                for name, _ in triggers:
+                    connection.exec_driver_sql(f"DROP TRIGGER {name}")
+
+                last_id = connection.execute(
+                    text("SELECT COALESCE(MAX(id), 0) FROM document")
+                ).scalar()
+                tag_ids = tag_resolver.resolve(connection, tags)
+
+                for batch in batched(documents, batch_size):
+                    document_ids = (
+                        connection.execute(
+                            insert(Document).returning(
+                                Document.id, sort_by_parameter_order=True
+                            ),
+                            [
+                                {
+                                    "title": doc_data["title"],
+                                    "description": doc_data["description"],
+                                    "content": doc_data["content"],
+                                }
+                                for doc_data in batch
+                            ],
+                        )
+                        .scalars()
+                        .all()
+                    )
+                    links = [
+                        {"document_id": document_id, "tag_id": tag_ids[tag_name]}
+                        for document_id, doc_data in zip(document_ids, batch)
+                        for tag_name in set(doc_data["tags"])
+                    ]
+                    if links:
+                        connection.execute(insert(DocumentTag), links)
+
+                index_documents(connection, "d.id > :last_id", {"last_id": last_id})
+                if "document_trigram_ai" in dict(triggers):
+                    connection.execute(
+                        text(
+                            """
+                            INSERT INTO documentfts_trigram(rowid, title, description, content)
+                            SELECT id, title, description, content
+                            FROM document
+                            WHERE id > :last_id
+                            """
+                        ),
+                        {"last_id": last_id},
+                    )
+
+                for _, sql in triggers:
+                    connection.exec_driver_sql(sql)
+
+                if get_settings().vector_search_enabled:
+                    backfill_embeddings(connection)
+        finally:
+            # Whatever happened, never leave the database without its
+            # indexing triggers
+            _restore_triggers(connection, triggers)
+
+
+def _restore_triggers(connection, triggers) -> None:
+    """Recreate any of `triggers` (name, sql pairs) that no longer exist"""
+    existing = set(
+        connection.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        ).scalars()
+    )
+    for name, sql in triggers:
+        if name not in existing:
+            connection.exec_driver_sql(sql)
+    connection.commit()
 
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python -m utils.load_data <json_file>")
-        sys.exit(1)
-    
-    json_file = Path(sys.argv[1])
-    if not json_file.exists():
-        print(f"Error: File {json_file} does not exist")
+    parser = argparse.ArgumentParser(prog="python -m utils.load_data")
+    parser.add_argument("json_file", type=Path)
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="defer indexing and insert in large batches; for big initial loads",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="documents read and written per batch",
+    )
+    args = parser.parse_args()
+
+    if not args.json_file.exists():
+        print(f"Error: File {args.json_file} does not exist")
         sys.exit(1)
 
-    load_data(json_file)
+    load_data(args.json_file, bulk=args.bulk, batch_size=args.batch_size)
     print("Data loaded successfully!")
 
 
@@ -1,21 +1,88 @@
+import hashlib
+import io
 import sys
 import json
 import zipfile
 from pathlib import Path
-from typing import Dict, List
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 from datetime import datetime
 import re
-from app.models import Document, Tag
+from app.models import ConversationImport, Document, Tag
 from utils.load_data import load_data
+from utils.json_stream import iter_array
+from utils.llm_pipeline import ReliableModel, ResponseCache, TokenBucket, TokenBudget
 from sqlmodel import Session, select
 from app.main import engine
-import llm
+from app.tags import tag_resolver
+import argparse
 import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-model = llm.get_model("gpt-4o-mini")
+MODEL_ID = "gpt-4o-mini"
 
+_model = None
 
-def score_conversation(messages: List[str], title: str) -> bool:
+
+def get_model():
+    global _model
+    if _model is None:
+        import llm
+
+        _model = llm.get_model(MODEL_ID)
+    return _model
+
+
+# Cache keys for the prompts; bump the version when a prompt's wording
+# changes so replies to the old wording are not reused
+SCORE_PROMPT = "score-v1"
+TAG_PROMPT = "tag-v1"
+
+
+def default_cache_path() -> Optional[Path]:
+    """The response cache lives next to a file-backed app database"""
+    database = engine.url.database
+    if not database or database == ":memory:":
+        return None
+    return Path(database).with_suffix(".llm-cache.db")
+
+
+def prompt_model(
+    model,
+    cache: Optional[ResponseCache],
+    prompt_name: str,
+    content: str,
+    prompt: str,
+    valid: Callable[[str], bool] = lambda reply: True,
+) -> str:
+    """
+    Return the model's reply to `prompt`, built from `content`, using the
+    cached reply if there is one. Only replies passing `valid` are cached.
+    """
+    model = model or get_model()
+    model_id = getattr(model, "model_id", type(model).__name__)
+    if cache:
+        reply = cache.get(model_id, prompt_name, content)
+        if reply is not None:
+            return reply
+    reply = model.prompt(prompt).text()
+    if cache and valid(reply):
+        cache.set(model_id, prompt_name, content, reply)
+    return reply
+
+
+def is_json(reply: str) -> bool:
+    try:
+        json.loads(reply)
+    except ValueError:
+        return False
+    return True
+
+
+def score_conversation(
+    messages: List[str], title: str, model=None, cache: ResponseCache = None
+) -> bool:
     """
     Determine if a conversation is interesting enough to store.
     Criteria:
@@ -25,7 +92,11 @@ def score_conversation(messages: List[str], title: str) -> bool:
     """
 
     content = "\n".join(messages)
-    response = model.prompt(
+    score = prompt_model(
+        model,
+        cache,
+        SCORE_PROMPT,
+        content,
         f"""Score the following text for interestingness on a scale of 0-2, as follows. Just return a number. It must be 0, 1 or 2; nothing else. It should not have a dot after it.
 
 0: Short text defining words, short technical solutions, or playful silly things, or longer text which is mostly programming or code               
@@ -36,25 +107,36 @@ def score_conversation(messages: List[str], title: str) -> bool:
 # Text to score
 
 {content}
-"""
+""",
+        valid=lambda reply: reply in ["0", "1", "2"],
     )
-    score = response.text()
     if score not in ["0", "1", "2"]:
         print(f"Weird score {score}")
         return None
     return int(score)
 
 
-def tag_conversation(messages: List[str], title: str) -> bool:
+def tag_conversation(
+    messages: List[str],
+    title: str,
+    model=None,
+    existing_tags: str = None,
+    cache: ResponseCache = None,
+) -> bool:
 
     content = "\n".join(messages)
-    # Fetch existing tags from database
-    with Session(engine) as session:
-        tags = session.exec(select(Tag)).all()
-        existing_tags = json.dumps(
-            [{"name": tag.name, "description": tag.description} for tag in tags]
-        )
-    response = model.prompt(
+    if existing_tags is None:
+        # Fetch existing tags from database
+        with Session(engine) as session:
+            tags = session.exec(select(Tag)).all()
+            existing_tags = json.dumps(
+                [{"name": tag.name, "description": tag.description} for tag in tags]
+            )
+    return prompt_model(
+        model,
+        cache,
+        TAG_PROMPT,
+        content,
         """Return an array of json tags that categories the following text. At least 1 tag, and no more than 4 tags. Do not return it in a code fence. No code fences, your output should start with `[{"}`]
 
         Tag names should be lower-cased and snake-cased.
@@ -76,10 +158,9 @@ def tag_conversation(messages: List[str], title: str) -> bool:
 
 %s
 """
-        % (existing_tags, content)
+        % (existing_tags, content),
+        valid=is_json,
     )
-    result = response.text()
-    return result
 
 
 def extract_message_parts(message):
@@ -122,38 +203,69 @@ def get_conversation_messages(conversation):
     return messages[::-1]  # Reverse to get chronological order
 
 
-def extract_messages(zip_path: Path) -> List[Dict]:
+def iter_messages(zip_path: Path) -> Iterator[Dict]:
     """
-    Extract all conversations and their messages from a ChatGPT export zip file
+    Yield the conversations in a ChatGPT export zip file one at a time,
+    without loading the whole of conversations.json
     """
-    conversations_data = []
-
     with zipfile.ZipFile(zip_path) as zf:
         with zf.open("conversations.json") as f:
-            conversations = json.load(f)
-
-        for conv_data in conversations:
-            title = conv_data.get("title", "Untitled Conversation")
-            messages = get_conversation_messages(conv_data)
-            create_time = conv_data.get("create_time", 0)
-            created_at = (
-                datetime.fromtimestamp(create_time)
-                if create_time
-                else datetime.utcnow()
-            )
+            for conv_data in iter_array(io.TextIOWrapper(f, encoding="utf-8")):
+                title = conv_data.get("title", "Untitled Conversation")
+                messages = get_conversation_messages(conv_data)
+                create_time = conv_data.get("create_time", 0)
+                created_at = (
+                    datetime.fromtimestamp(create_time)
+                    if create_time
+                    else datetime.utcnow()
+                )
 
-            conversations_data.append(
-                {"title": title, "messages": messages, "created_at": created_at}
-            )
+                digest = content_hash(title, messages)
+                # Without an id, fall back on something that survives edits
+                # to the conversation, so a changed one isn't imported twice
+                conversation_id = (
+                    conv_data.get("conversation_id")
+                    or conv_data.get("id")
+                    or (f"created-{create_time}" if create_time else digest)
+                )
+                yield {
+                    "conversation_id": conversation_id,
+                    "update_time": conv_data.get("update_time"),
+                    "content_hash": digest,
+                    "title": title,
+                    "messages": messages,
+                    "created_at": created_at,
+                }
 
-    return conversations_data
 
+def content_hash(title: str, messages: List[str]) -> str:
+    """Hash of what gets stored for a conversation"""
+    return hashlib.sha256(json.dumps([title, messages]).encode()).hexdigest()
 
-def extract_tags(zip_path: Path) -> Dict:
-    conversations_data = extract_messages(zip_path)
+
+class Reservoir:
+    """A uniform random sample of up to `k` items from a stream of unknown length"""
+
+    def __init__(self, k: int):
+        self.k = k
+        self.seen = 0
+        self.items = []
+
+    def add(self, item) -> None:
+        self.seen += 1
+        if len(self.items) < self.k:
+            self.items.append(item)
+        else:
+            j = random.randrange(self.seen)
+            if j < self.k:
+                self.items[j] = item
+
+
+def discover_tags(sample: List[Dict], model=None) -> str:
+    """Ask the model for a tag vocabulary covering a sample of conversations"""
     content = ""
     count = 1
-    for conv_data in random.sample(conversations_data, 100):
+    for conv_data in sample:
         title = conv_data["title"]
         messages = conv_data["messages"]
         print(f"Title: {title}")
@@ -166,7 +278,7 @@ def extract_tags(zip_path: Path) -> Dict:
         else:
             content += f"{joined}\n\n-----\n\n"
             count += 1
-    response = model.prompt(
+    response = (model or get_model()).prompt(
         """Return an array of json tags that could categorise the following text snippets. There are 50 separated with ----- markers. 
             
             A total of a maximum of 20 tags that together cover the 50 snippets. Just return the raw json, no code fences, your output should start with `[{"}`]
@@ -184,87 +296,402 @@ def extract_tags(zip_path: Path) -> Dict:
     """
         % content
     )
-    tags = response.text()
-    return update_tags(tags, skip_on_fail=False)
+    return response.text()
 
 
-def update_tags(tags, skip_on_fail=True):
-    with Session(engine) as session:
-        # Parse tags JSON and create/get Tag objects
-        try:
-            tag_list = json.loads(tags)
-        except:
-            print(f"*** invalid tag list {tags}")
-            if skip_on_fail:
-                tag_list = []
-            else:
-                raise RuntimeError("Invalid tag list")
-        document_tags = []
-        for tag_data in tag_list:
-            # Check if tag exists
-            tag = session.exec(select(Tag).where(Tag.name == tag_data["name"])).first()
-            if not tag:
-                # Create new tag if it doesn't exist
-                tag = Tag(
-                    name=tag_data["name"],
-                    description=tag_data.get("description", ""),
-                )
-                session.add(tag)
-            document_tags.append(tag)
-        session.commit()
-        for tag in document_tags:
-            session.refresh(tag)
-        return document_tags
+def parse_tags(tags, skip_on_fail=True) -> List[Dict]:
+    """Parse a model's JSON tag list"""
+    try:
+        return json.loads(tags)
+    except:
+        print(f"*** invalid tag list {tags}")
+        if skip_on_fail:
+            return []
+        raise RuntimeError("Invalid tag list")
 
 
-def extract_conversations(zip_path: Path) -> Dict:
+class TagCatalog:
     """
-    Extract conversations from ChatGPT export zip file and store in database
+    The existing tags offered to the tagging prompt. Workers read it while
+    the writer adds the tags they invent.
     """
-    conversations_data = extract_messages(zip_path)
 
-    for conv_data in conversations_data:
-        title = conv_data["title"]
-        messages = conv_data["messages"]
-        print(f"Title: {title}")
+    def __init__(self, tags: List[Tag]):
+        self._lock = threading.Lock()
+        self._tags = {tag.name: tag.description for tag in tags}
+
+    def add(self, name: str, description: str) -> None:
+        with self._lock:
+            self._tags[name] = description
+
+    def to_json(self) -> str:
+        with self._lock:
+            return json.dumps(
+                [
+                    {"name": name, "description": description}
+                    for name, description in self._tags.items()
+                ]
+            )
 
-        # Combine messages into content
-        content = "\n\n".join(messages)
-
-        # Only store interesting conversations
-        interestingness = score_conversation(messages, title)
-        print(f"Processing interesting conversation: {title}")
-        if interestingness:
-            tags = tag_conversation(messages, title)
-            print(title, tags)
-        else:
-            tags = "[]"
 
-        # Create document and handle tags in database
-        document_tags = update_tags(tags)
-        with Session(engine) as session:
-            # Create document with tags
+def fit_messages(
+    messages: List[str], budget: Optional[TokenBudget]
+) -> Tuple[List[str], Optional[int]]:
+    """
+    Abridge long conversations so each prompt takes bounded time; return
+    the messages to send and the budget they were cut to, if they were
+    """
+    if budget:
+        messages, cut = budget.fit(messages)
+        if cut:
+            return messages, budget.total
+    return messages, None
+
+
+def analyse_conversation(
+    conv_data: Dict,
+    model,
+    cache: Optional[ResponseCache] = None,
+    budget: Optional[TokenBudget] = None,
+) -> Dict:
+    """Score one conversation; runs on a worker thread"""
+    messages, token_budget = fit_messages(conv_data["messages"], budget)
+    return {
+        **conv_data,
+        "interestingness": score_conversation(messages, conv_data["title"], model, cache),
+        "token_budget": token_budget,
+    }
+
+
+def tag_document(
+    document: Dict,
+    model,
+    catalog: TagCatalog,
+    cache: Optional[ResponseCache] = None,
+    budget: Optional[TokenBudget] = None,
+) -> Dict:
+    """Tag one stored interesting conversation; runs on a worker thread"""
+    messages, _ = fit_messages([document["content"]], budget)
+    tags = tag_conversation(messages, document["title"], model, catalog.to_json(), cache)
+    print(document["title"], tags)
+    return {**document, "tags": tags}
+
+
+def run_in_order(
+    executor: ThreadPoolExecutor,
+    workers: int,
+    items: Iterable[Dict],
+    analyse: Callable[[Dict], Dict],
+    write: Callable[[Dict], None],
+) -> None:
+    """
+    Run `analyse` on each item on `executor` and `write` the results in
+    input order on the calling thread, with at most 2 * `workers` items in
+    flight. Items whose analysis fails are reported and skipped.
+    """
+    in_flight = deque()
+
+    def write_next():
+        item, future = in_flight.popleft()
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"*** skipping {item['title']!r}: {e}")
+            return
+        write(result)
+
+    for item in items:
+        in_flight.append((item, executor.submit(analyse, item)))
+        if len(in_flight) >= 2 * workers:
+            write_next()
+    while in_flight:
+        write_next()
+
+
+class ImportState(NamedTuple):
+    update_time: Optional[float]
+    content_hash: str
+    document_id: Optional[int]
+
+
+class DocumentWriter:
+    """
+    Stores analysed conversations from a single thread, committing every
+    `batch_size` documents.
+
+    Each document is committed together with its `ConversationImport` row,
+    so every commit is a checkpoint: a rerun after an interruption skips
+    whatever was committed and picks up the rest.
+    """
+
+    def __init__(self, session: Session, catalog: TagCatalog, batch_size: int):
+        self.session = session
+        self.catalog = catalog
+        self.batch_size = batch_size
+        self.tags = {tag.name: tag for tag in session.exec(select(Tag))}
+        self.imports = {
+            conversation_id: ImportState(update_time, digest, document_id)
+            for conversation_id, update_time, digest, document_id in session.exec(
+                select(
+                    ConversationImport.conversation_id,
+                    ConversationImport.update_time,
+                    ConversationImport.content_hash,
+                    ConversationImport.document_id,
+                )
+            )
+        }
+        self.pending = 0
+        self.created = self.updated = self.skipped = 0
+
+    def is_unchanged(self, conv_data: Dict) -> bool:
+        """Whether the conversation was already imported in its current form"""
+        state = self.imports.get(conv_data["conversation_id"])
+        # The content hash decides; update_time can stay put while what we
+        # extract from a conversation changes
+        if state is None or state.content_hash != conv_data["content_hash"]:
+            return False
+        if state.update_time != conv_data["update_time"]:
+            # Touched without changing what we store
+            self._record(conv_data, state.document_id)
+        return True
+
+    def resolve_tags(self, tag_list: List[Dict]) -> List[Tag]:
+        """Get or create the tags in a parsed tag list"""
+        descriptions = {}
+        for tag_data in tag_list:
+            descriptions.setdefault(tag_data["name"], tag_data.get("description", ""))
+        tag_ids = tag_resolver.resolve(self.session.connection(), descriptions)
+        tags = []
+        for name, tag_id in tag_ids.items():
+            if name not in self.tags:
+                self.tags[name] = self.session.get(Tag, tag_id)
+                self.catalog.add(name, self.tags[name].description)
+            tags.append(self.tags[name])
+        return tags
+
+    def write(self, result: Dict) -> None:
+        """Store a scored conversation; interesting ones are tagged later"""
+        print(f"Storing conversation: {result['title']}")
+        state = self.imports.get(result["conversation_id"])
+        document = None
+        if state and state.document_id:
+            document = self.session.get(Document, state.document_id)
+        if document is None:
             document = Document(
-                tags=document_tags,
-                title=title,
                 description="",  # Empty description as requested
-                content=content,
-                created_at=conv_data["created_at"],
-                updated_at=conv_data["created_at"],
+                created_at=result["created_at"],
+                updated_at=result["created_at"],
+            )
+            self.created += 1
+        else:
+            # Changed since the last import; update it in place
+            document.updated_at = (
+                datetime.fromtimestamp(result["update_time"])
+                if result["update_time"]
+                else datetime.utcnow()
             )
-            session.add(document)
-            session.commit()
+            self.updated += 1
+        if not result["interestingness"]:
+            document.tags = []
+        document.title = result["title"]
+        document.content = "\n\n".join(result["messages"])
+        document.interestingness = result["interestingness"]
+        self.session.add(document)
+        self.session.flush()
+        self._record(result, document.id, needs_tags=bool(result["interestingness"]))
+
+    def untagged(self) -> Iterator[Dict]:
+        """Yield the stored conversations still waiting to be tagged"""
+        pending = self.session.exec(
+            select(ConversationImport.conversation_id, ConversationImport.document_id)
+            .where(ConversationImport.needs_tags)
+            .order_by(ConversationImport.document_id)
+        ).all()
+        for conversation_id, document_id in pending:
+            document = self.session.exec(
+                select(Document.title, Document.content).where(Document.id == document_id)
+            ).first()
+            if document:
+                yield {
+                    "conversation_id": conversation_id,
+                    "document_id": document_id,
+                    "title": document.title,
+                    "content": document.content,
+                }
+
+    def tag(self, result: Dict) -> None:
+        """Store the tags chosen for a conversation from `untagged`"""
+        document = self.session.get(Document, result["document_id"])
+        document.tags = self.resolve_tags(parse_tags(result["tags"]))
+        record = self.session.get(ConversationImport, result["conversation_id"])
+        record.needs_tags = False
+        self.session.add_all([document, record])
+        self._count()
+
+    def _record(
+        self,
+        conv_data: Dict,
+        document_id: Optional[int],
+        needs_tags: Optional[bool] = None,
+    ) -> None:
+        conversation_id = conv_data["conversation_id"]
+        record = self.session.get(ConversationImport, conversation_id)
+        if record is None:
+            record = ConversationImport(conversation_id=conversation_id)
+        record.update_time = conv_data["update_time"]
+        record.content_hash = conv_data["content_hash"]
+        record.token_budget = conv_data.get("token_budget", record.token_budget)
+        record.document_id = document_id
+        if needs_tags is not None:
+            record.needs_tags = needs_tags
+        record.imported_at = datetime.utcnow()
+        self.session.add(record)
+        self.imports[conversation_id] = ImportState(
+            conv_data["update_time"], conv_data["content_hash"], document_id
+        )
+        self._count()
+
+    def _count(self) -> None:
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        self.session.commit()
+        self.pending = 0
+
+
+def extract_conversations(
+    zip_path: Path,
+    workers: int = 8,
+    requests_per_minute: float = 500,
+    batch_size: int = 50,
+    sample_size: int = 100,
+    model=None,
+    cache: Optional[ResponseCache] = None,
+    budget: Optional[TokenBudget] = TokenBudget(),
+) -> Dict:
+    """
+    Extract conversations from ChatGPT export zip file and store in database.
+
+    conversations.json is read in a single streaming pass, in which new and
+    changed conversations are scored and stored. Meanwhile a reservoir
+    keeps a random sample of `sample_size` of them; once the pass is done
+    the model proposes a tag vocabulary from it, and the interesting
+    documents are then tagged, read back from the database, with that
+    vocabulary offered as existing tags.
+
+    Scoring and tagging run on `workers` threads sharing one rate limit;
+    results are written in input order by the calling thread. At most
+    2 * `workers` conversations are in flight at once.
+
+    Conversations already imported with the same content are skipped
+    without calling the model; changed ones update their document in place.
+    Progress is committed every `batch_size` documents, also when the run
+    is interrupted, so a rerun resumes from there, including tagging.
+
+    With a `cache`, scoring and tagging replies for text seen before (by the
+    same model and prompt version) are reused instead of requested again.
+
+    Conversations longer than `budget` are abridged before they are sent;
+    the budget used is recorded on their `ConversationImport` row.
+    """
+    model = ReliableModel(
+        model or get_model(),
+        TokenBucket(requests_per_minute / 60, capacity=workers),
+    )
+    with Session(engine) as session:
+        catalog = TagCatalog(session.exec(select(Tag)).all())
+        writer = DocumentWriter(session, catalog, batch_size)
+        executor = ThreadPoolExecutor(workers)
+        sample = Reservoir(sample_size)
+
+        def new_conversations():
+            for conv_data in iter_messages(zip_path):
+                if writer.is_unchanged(conv_data):
+                    writer.skipped += 1
+                    continue
+                sample.add(conv_data)
+                yield conv_data
+
+        try:
+            run_in_order(
+                executor,
+                workers,
+                new_conversations(),
+                lambda conv_data: analyse_conversation(conv_data, model, cache, budget),
+                writer.write,
+            )
+
+            if sample.items:
+                writer.resolve_tags(
+                    parse_tags(discover_tags(sample.items, model), skip_on_fail=False)
+                )
+            writer.flush()
+
+            run_in_order(
+                executor,
+                workers,
+                writer.untagged(),
+                lambda document: tag_document(document, model, catalog, cache, budget),
+                writer.tag,
+            )
+        finally:
+            # Keep what was written so far as the checkpoint to resume from
+            executor.shutdown(cancel_futures=True)
+            writer.flush()
+        print(
+            f"Created {writer.created}, updated {writer.updated}, "
+            f"skipped {writer.skipped} unchanged conversations"
+        )
+        if cache:
+            print(f"Model response cache: {cache.stats()}")
 
     # Return empty dict since we're not using load_data anymore
     return {"tags": {}, "documents": []}
 
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python -m utils.load_data_from_chatgpt_history <zip_file>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(prog="python -m utils.load_data_from_chatgpt_history")
+    parser.add_argument("zip_file", type=Path)
+    parser.add_argument("--workers", type=int, default=8, help="concurrent model requests")
+    parser.add_argument(
+        "--rpm", type=float, default=500, help="model requests per minute, across workers"
+    )
+    parser.add_argument("--batch-size", type=int, default=50, help="documents per commit")
+    parser.add_argument(
+        "--sample-size",
+        type=int,
+        default=100,
+        help="conversations sampled for tag discovery; 0 to skip it",
+    )
+    parser.add_argument(
+        "--llm-cache",
+        type=Path,
+        default=default_cache_path(),
+        help="SQLite file caching model replies (default: next to the database)",
+    )
+    parser.add_argument("--no-llm-cache", action="store_true")
+    parser.add_argument(
+        "--llm-cache-max-mb", type=float, default=256, help="evict beyond this size"
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=8000,
+        help="abridge conversations longer than this many tokens; 0 to send them whole",
+    )
+    parser.add_argument(
+        "--edge-tokens",
+        type=int,
+        default=1000,
+        help="tokens always kept from the start and the end of abridged conversations",
+    )
+    args = parser.parse_args()
+    if args.token_budget < 0 or args.edge_tokens < 0:
+        parser.error("--token-budget and --edge-tokens must not be negative")
 
-    zip_path = Path(sys.argv[1])
+    zip_path = args.zip_file
     if not zip_path.exists():
         print(f"Error: File {zip_path} does not exist")
         sys.exit(1)
@@ -273,10 +700,22 @@ def main():
         print(f"Error: {zip_path} is not a valid zip file")
         sys.exit(1)
 
+    cache = None
+    if args.llm_cache and not args.no_llm_cache:
+        cache = ResponseCache(args.llm_cache, int(args.llm_cache_max_mb * 1024 * 1024))
+
     # Process conversations
-    tags = extract_tags(zip_path)
-    breakpoint()
-    extract_conversations(zip_path)
+    extract_conversations(
+        zip_path,
+        workers=args.workers,
+        requests_per_minute=args.rpm,
+        batch_size=args.batch_size,
+        sample_size=args.sample_size,
+        cache=cache,
+        budget=(
+            TokenBudget(args.token_budget, args.edge_tokens) if args.token_budget else None
+        ),
+    )
     print("Interesting ChatGPT conversations loaded successfully!")
 
 